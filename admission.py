@@ -0,0 +1,178 @@
+import copy
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (
+    FIRESTORE_MAX_CONCURRENT_CALLS,
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_RETRY_AFTER_SECONDS,
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request could not get a Firestore slot in time"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many concurrent requests, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution.
+    The first caller runs the function; everyone arriving while it is
+    still running waits and receives the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn(*args, **kwargs)
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+class AdmissionController:
+    """
+    Per-process limit on concurrent Firestore calls.
+    Callers queue for up to max_wait seconds and are then rejected with a
+    suggested retry-after delay instead of piling more load on Firestore.
+    """
+
+    def __init__(self, max_concurrent, max_wait, retry_after):
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._active = 0
+        self._stats = {'admitted': 0, 'rejected': 0, 'max_queue_depth': 0}
+
+    def _suggest_retry_after(self):
+        # Scale with queue depth and add jitter so retries don't arrive together
+        backlog = self._waiting / max(self.max_concurrent, 1)
+        return self.retry_after * (1 + backlog) * random.uniform(1.0, 1.5)
+
+    def suggest_retry_after(self):
+        """A freshly jittered retry delay, for callers rejected on someone else's behalf"""
+        with self._lock:
+            return self._suggest_retry_after()
+
+    @contextmanager
+    def slot(self):
+        with self._lock:
+            self._waiting += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._waiting)
+
+        acquired = self._slots.acquire(timeout=self.max_wait)
+
+        with self._lock:
+            self._waiting -= 1
+            if acquired:
+                self._active += 1
+                self._stats['admitted'] += 1
+            else:
+                self._stats['rejected'] += 1
+                retry_after = self._suggest_retry_after()
+
+        if not acquired:
+            raise AdmissionRejected(retry_after)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn while holding a Firestore slot"""
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'queue_depth': self._waiting,
+                'active': self._active,
+                'max_concurrent': self.max_concurrent,
+                **self._stats,
+            }
+
+
+firestore_gate = AdmissionController(
+    FIRESTORE_MAX_CONCURRENT_CALLS,
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_RETRY_AFTER_SECONDS,
+)
+ticket_loads = SingleFlight()
+
+
+def load_ticket(db, ticket_id):
+    """
+    Fetch a ticket through the admission layer.
+    Concurrent loads of the same ticket share a single Firestore read.
+
+    Returns:
+        dict: A private copy of the ticket, or None if it does not exist
+
+    Raises:
+        AdmissionRejected: If no Firestore slot became free in time
+    """
+    from firebase_helper import get_exit_ticket
+
+    ticket_id = ticket_id.upper().strip()
+    try:
+        ticket_data = ticket_loads.do(ticket_id, firestore_gate.call, get_exit_ticket, db, ticket_id)
+    except AdmissionRejected:
+        # Coalesced callers share the leader's rejection; give each its own delay
+        # so a whole class does not retry at the same moment
+        raise AdmissionRejected(firestore_gate.suggest_retry_after()) from None
+    # Callers mutate the ticket in session state, so never hand out the shared object
+    return copy.deepcopy(ticket_data)
+
+
+def check_attempted(db, ticket_id, student_name):
+    """
+    Rate-limited check_student_already_attempted
+
+    Raises:
+        AdmissionRejected: If no Firestore slot became free in time
+    """
+    from firebase_helper import check_student_already_attempted
+
+    return firestore_gate.call(check_student_already_attempted, db, ticket_id, student_name)
+
+
+def admission_metrics():
+    """Queue depth, rejection and coalescing counters for this process"""
+    return {**firestore_gate.metrics(), 'coalesced_ticket_loads': ticket_loads.coalesced}
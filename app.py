@@ -1,75 +1,162 @@
 import streamlit as st
 from firebase_helper import init_firestore
+from session_store import checkpoint_session, restore_session, clear_session_checkpoint
+from ticket_compiler import get_compiled_ticket, select_for_student, questions_for_student, variant_records, TicketValidationError
 import google.generativeai as genai
 import json
 import os
-import random
 import time
 
 st.set_page_config(page_title="Exit Ticket - Student Portal", layout="wide")
 
-from config import DEFAULT_QUESTIONS_COUNT
+from config import DEFAULT_QUESTIONS_COUNT, STRATIFY_QUESTION_SELECTION, PREWARM_ENABLED, PROFILE_RERUNS, PROFILE_ADMIN_TOKEN
 from ui import app_ui
+from prewarm import start_prewarmer, load_student_plan
+from profiler import profile_rerun
+from session_lifecycle import get_lifecycle_manager, init_quiz_state, reset_quiz_state
 
 db = init_firestore()
 
+# Load tickets scheduled to open soon before the class arrives
+if PREWARM_ENABLED:
+    start_prewarmer(db)
+
+# Evicts quiz state of idle sessions and tracks per-session memory
+lifecycle = get_lifecycle_manager(db)
+
 GOOGLE_API_KEY = st.secrets["api_keys"]["google_api_key"]
 
 if GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
 
 def main():
-    st.markdown(
-        app_ui,
-        unsafe_allow_html=True
-    )
-    
-    # Direct to student dashboard - no login required
-    student_dashboard()
+    lifecycle.touch()
+
+    admin = is_admin_request()
+    if admin and get_query_param("view") == "profiles":
+        show_profiler_page()
+        return
+
+    # Profiling is opt-in; when off this is a plain pass-through
+    with profile_rerun(current_page_name(), enabled=PROFILE_RERUNS or admin, root_file=__file__):
+        st.markdown(
+            app_ui,
+            unsafe_allow_html=True
+        )
+        
+        # Direct to student dashboard - no login required
+        student_dashboard()
+
+def get_query_param(name):
+    """Read a query parameter on both old and new Streamlit versions"""
+    try:
+        return st.query_params.get(name)
+    except AttributeError:
+        values = st.experimental_get_query_params().get(name)
+        return values[0] if values else None
+
+def is_admin_request():
+    """Admins open the portal with ?profile=<PROFILE_ADMIN_TOKEN>"""
+    return bool(PROFILE_ADMIN_TOKEN) and get_query_param("profile") == PROFILE_ADMIN_TOKEN
+
+def current_page_name():
+    """Name of the page this rerun is about to render"""
+    if st.session_state.get('ticket_data') is None:
+        return "waiting" if st.session_state.get('ticket_pending_access') else "input"
+    return "results" if st.session_state.get('ticket_quiz_completed') else "quiz"
+
+def show_profiler_page():
+    """Admin page listing the slowest profiled reruns of this worker"""
+    from profiler import slow_reruns, format_collapsed
+    from admission import admission_metrics
+    from shared_cache import get_shared_cache
+
+    st.title("🛠️ Slow Reruns")
+    st.caption("Slowest profiled reruns of this worker. Download a profile and open it in speedscope or flamegraph.pl.")
+
+    metrics_col, cache_col = st.columns(2)
+    with metrics_col:
+        st.markdown("**Admission control**")
+        st.json(admission_metrics())
+    with cache_col:
+        st.markdown("**Shared cache**")
+        cache = get_shared_cache()
+        st.json(cache.stats() if cache else {"backend": "disabled"})
+
+    st.markdown("**Session memory**")
+    st.json(lifecycle.memory_report(), expanded=False)
+
+    records = slow_reruns.slowest()
+    if not records:
+        st.info("No profiled reruns yet. Set PROFILE_RERUNS=true or browse the portal with the profile query parameter.")
+        return
+
+    for i, record in enumerate(records):
+        total_samples = sum(record['samples'].values())
+        title = f"{record['duration_ms']:.0f} ms - {record['page']} - {record['started_at']:%H:%M:%S}"
+        with st.expander(title):
+            top_stacks = sorted(record['samples'].items(), key=lambda x: x[1], reverse=True)[:15]
+            for stack, count in top_stacks:
+                st.markdown(f"`{count / total_samples * 100:5.1f}%` {stack.replace(';', ' → ')}")
+            if record.get('path'):
+                st.caption(f"Saved to {record['path']}")
+            st.download_button(
+                "⬇️ Download collapsed stacks",
+                data=format_collapsed(record['samples']),
+                file_name=f"rerun-{record['page']}-{record['duration_ms']:.0f}ms.folded",
+                key=f"profile_download_{i}"
+            )
 
 def student_dashboard():
     st.title("🎓 Student Portal - Exit Ticket")
     st.markdown("Enter the ticket code provided by your teacher to start the exit ticket.")
 
     # MODIFIED: Initialize session state for exit tickets with submission tracking
-    for key, default in {
-        "ticket_data": None,
-        "ticket_current_question": 0,
-        "ticket_user_answers": {},
-        "ticket_quiz_completed": False,
-        "ticket_show_feedback": False,
-        "ticket_last_user_answer": None,
-        "ticket_question_submitted": {},  
-        "ticket_question_flags": {}       
-    }.items():
-        if key not in st.session_state:
-            st.session_state[key] = default
+    init_quiz_state(st.session_state)
 
     # Flow control for exit tickets
     if st.session_state.ticket_data is None:
         show_ticket_input_page()
+        return
 
-    elif not st.session_state.ticket_quiz_completed:
-        # 🔁 Randomly select only 3 questions once - BUT PRESERVE ORIGINAL INDICES
-        if 'ticket_initialized' not in st.session_state:
-            all_questions = st.session_state.ticket_data['questions']
-            
-            for i, question in enumerate(all_questions):
-                question['original_index'] = i
-            
-            # Select random questions but preserve their original indices
-            selected_questions = random.sample(all_questions, min(DEFAULT_QUESTIONS_COUNT, len(all_questions)))
-            
-            # Ensure each question maintains its original option order
-            for question in selected_questions:
-                pass
-            
-            st.session_state.ticket_data['questions'] = selected_questions
-            st.session_state.ticket_current_question = 0
-            st.session_state.ticket_user_answers = {}
-            st.session_state.ticket_quiz_completed = False
-            st.session_state.ticket_initialized = True
+    # 🔁 Select only 3 questions once - BUT PRESERVE ORIGINAL INDICES
+    if 'ticket_initialized' not in st.session_state:
+        ticket_data = st.session_state.ticket_data
+        all_questions = ticket_data['questions']
+        
+        for i, question in enumerate(all_questions):
+            question['original_index'] = i
+
+        # Validated once per process; render paths only read the compiled questions
+        compiled = get_compiled_ticket(ticket_data)
+        
+        # Same student + ticket + bank always gets the same questions, on any worker.
+        # Pre-warmed tickets with a roster already have the student's plan in the cache.
+        plan = load_student_plan(compiled, st.session_state.student_name) or {}
+        selected_indices = st.session_state.ticket_selected_indices
+        if selected_indices is None:
+            selected_indices = plan.get('indices') or select_for_student(
+                compiled,
+                ticket_data,
+                st.session_state.student_name,
+                DEFAULT_QUESTIONS_COUNT,
+                stratify=ticket_data.get('stratify_by_topic', STRATIFY_QUESTION_SELECTION)
+            )
+
+        # Template questions become this student's own variant
+        selected_indices, st.session_state.ticket_questions = questions_for_student(
+            compiled, selected_indices, st.session_state.student_name, plan.get('variants')
+        )
+        st.session_state.ticket_selected_indices = selected_indices
+        selected_questions = [all_questions[i] for i in selected_indices]
+        
+        st.session_state.ticket_data['questions'] = selected_questions
+        st.session_state.ticket_initialized = True
+
+    # Persist progress made since the last rerun so any worker can resume it
+    checkpoint_session(db, st.session_state)
 
+    if not st.session_state.ticket_quiz_completed:
         show_ticket_quiz_page()
 
     else:
@@ -77,6 +164,14 @@ def student_dashboard():
 
 def show_ticket_input_page():
     """Page for students to enter ticket ID and name"""
+
+    pending = st.session_state.get('ticket_pending_access')
+    if pending:
+        show_ticket_waiting_page(pending)
+        return
+
+    if st.session_state.pop('ticket_session_evicted', False):
+        st.info("⏸️ Your exit ticket was paused after a period of inactivity. Enter the same ticket code and name to continue where you left off.")
     
     st.markdown("### 🎫 Enter Ticket Information")
     
@@ -112,41 +207,71 @@ def show_ticket_input_page():
                 st.error("Please enter your name.")
                 return
             
-            # Retrieve ticket from database
-            from firebase_helper import get_exit_ticket, check_student_already_attempted
-            with st.spinner("Loading exit ticket..."):
-                ticket_data = get_exit_ticket(db, ticket_id)
-                
-                if ticket_data:
-                    if ticket_data.get('status') != 'active':
-                        st.error("This exit ticket is no longer active. Please contact your teacher.")
-                        return
-                    
-                    # Check if student has already attempted this ticket
-                    if check_student_already_attempted(db, ticket_id, student_name):
-                        st.error(f"❌ You have already completed this exit ticket!")
-                        st.info("Each student can attempt an exit ticket only once.")
-                        return
-                    
-                    # Store ticket data and student name in session state
-                    st.session_state.ticket_data = ticket_data
-                    st.session_state.student_name = student_name
-                    st.session_state.ticket_current_question = 0
-                    st.session_state.ticket_user_answers = {}
-                    st.session_state.ticket_quiz_completed = False
-                    st.session_state.ticket_show_feedback = False
-                    st.session_state.ticket_last_user_answer = None
-                    st.session_state.response_saved = False
-                    st.session_state.student_already_attempted = False
-                    
-                    st.rerun()
-                else:
-                    st.error("Invalid ticket code. Please check and try again.")
+            start_ticket_attempt(ticket_id, student_name)
+
+def start_ticket_attempt(ticket_id, student_name):
+    """Load the ticket through the admission layer and start the quiz"""
+    from admission import load_ticket, check_attempted, AdmissionRejected
+    st.session_state.ticket_pending_access = None
+
+    try:
+        with st.spinner("Loading exit ticket..."):
+            ticket_data = load_ticket(db, ticket_id)
+
+            if ticket_data:
+                if ticket_data.get('status') != 'active':
+                    st.error("This exit ticket is no longer active. Please contact your teacher.")
+                    return
+
+                try:
+                    get_compiled_ticket(ticket_data)
+                except TicketValidationError as e:
+                    print(f"Ticket {ticket_id} failed validation: {e}")
+                    st.error("This exit ticket has no valid questions. Please contact your teacher.")
+                    return
+
+                # Check if student has already attempted this ticket
+                if check_attempted(db, ticket_id, student_name):
+                    st.error(f"❌ You have already completed this exit ticket!")
+                    st.info("Each student can attempt an exit ticket only once.")
+                    return
+            else:
+                st.error("Invalid ticket code. Please check and try again.")
+                return
+    except AdmissionRejected as e:
+        # Busy moment (whole class joining at once) - wait and retry instead of failing
+        st.session_state.ticket_pending_access = {
+            "ticket_id": ticket_id,
+            "student_name": student_name,
+            "retry_at": time.time() + e.retry_after,
+        }
+        st.rerun()
+
+    # Store ticket data and student name in session state
+    reset_quiz_state(st.session_state)
+    st.session_state.ticket_data = ticket_data
+    st.session_state.student_name = student_name
+
+    # Resume progress saved by this or another worker before a disconnect
+    restore_session(db, st.session_state, ticket_id, student_name)
+
+    st.rerun()
+
+def show_ticket_waiting_page(pending):
+    """Waiting state shown while the portal is busy admitting other students"""
+    st.markdown("### ⏳ Joining Exit Ticket")
+    st.info("Lots of students are joining right now. You'll be let in automatically in a moment - please don't refresh.")
+    st.caption(f"Ticket Code: {pending['ticket_id']}")
+
+    wait = pending['retry_at'] - time.time()
+    if wait > 0:
+        time.sleep(wait)
+    start_ticket_attempt(pending['ticket_id'], pending['student_name'])
 
 def show_ticket_quiz_page():
     """Display the exit ticket quiz interface"""
     ticket_data = st.session_state.ticket_data
-    questions = ticket_data['questions']
+    questions = st.session_state.ticket_questions
     current_q = st.session_state.ticket_current_question
 
     # Initialize flags in session state if not exists
@@ -181,13 +306,13 @@ def show_ticket_quiz_page():
     st.progress(progress)
     st.caption(f"Question {current_q + 1} of {len(questions)}")
 
-    question_data = questions[current_q]
+    question = questions[current_q]
     
     # FIX: Get the original question index from the selected questions
-    original_question_index = question_data.get('original_index', current_q)
+    original_question_index = question.original_index
     
     st.subheader(f"Question {current_q + 1}")
-    st.markdown(f"**{question_data['question']}**")
+    st.markdown(f"**{question.text}**")
 
     # MODIFIED: Check if current question is already submitted using original index
     is_question_submitted = st.session_state.ticket_question_submitted.get(original_question_index, False)
@@ -219,21 +344,19 @@ def show_ticket_quiz_page():
         answer_given = original_question_index in st.session_state.ticket_user_answers
         form_disabled = is_question_submitted  # Disable entire form if submitted
 
-        # Keep options in A, B, C, D order - no randomization
-        option_keys = ['A', 'B', 'C', 'D']  # Fixed order
-        available_options = [key for key in option_keys if key in question_data['options']]
-        
+        # Options are precompiled in A, B, C, D order - the radio works on positions
         # MODIFIED: Set default value if answer exists using original index
-        default_answer = st.session_state.ticket_user_answers.get(original_question_index, available_options[0] if available_options else None)
+        default_answer = st.session_state.ticket_user_answers.get(original_question_index)
         
-        user_answer = st.radio(
+        selected_position = st.radio(
             "Select your answer:",
-            options=available_options,  # Use fixed order
-            format_func=lambda x: f"{x}) {question_data['options'][x]}",
+            options=range(len(question.option_keys)),
+            format_func=question.option_labels.__getitem__,
             key=f"ticket_radio_{current_q}",
-            index=available_options.index(default_answer) if default_answer in available_options else 0,
+            index=question.option_positions.get(default_answer, 0),
             disabled=form_disabled  # MODIFIED: Disable if submitted
         )
+        user_answer = question.option_keys[selected_position]
 
         # MODIFIED: Disable submit button if already submitted
         submitted = st.form_submit_button("Submit Answer", type="primary", disabled=form_disabled)
@@ -246,7 +369,7 @@ def show_ticket_quiz_page():
         st.session_state.ticket_user_answers[original_question_index] = user_answer
         st.session_state.ticket_last_user_answer = user_answer
 
-        correct_answer = question_data['correct_answer']
+        correct_answer = question.correct_answer
         if user_answer == correct_answer:
             st.success("✅ Correct!")
         else:
@@ -259,7 +382,7 @@ def show_ticket_quiz_page():
     # MODIFIED: Show feedback if question is submitted
     if is_question_submitted:
         user_answer = st.session_state.ticket_user_answers[original_question_index]
-        correct_answer = question_data['correct_answer']
+        correct_answer = question.correct_answer
         if user_answer == correct_answer:
             st.success("Submitted!")
         else:
@@ -283,9 +406,8 @@ def show_ticket_quiz_page():
             # FIXED: Check if ALL questions are answered, not just the last one
             def are_all_questions_answered():
                 """Check if all questions in the ticket have been answered"""
-                for i, question in enumerate(questions):
-                    original_idx = question.get('original_index', i)
-                    if not st.session_state.ticket_question_submitted.get(original_idx, False):
+                for question in questions:
+                    if not st.session_state.ticket_question_submitted.get(question.original_index, False):
                         return False
                 return True
             
@@ -300,8 +422,7 @@ def show_ticket_quiz_page():
                 unanswered_count = 0
                 unanswered_numbers = []
                 for i, question in enumerate(questions):
-                    original_idx = question.get('original_index', i)
-                    if not st.session_state.ticket_question_submitted.get(original_idx, False):
+                    if not st.session_state.ticket_question_submitted.get(question.original_index, False):
                         unanswered_count += 1
                         unanswered_numbers.append(i + 1)  # Display 1-based question numbers
                 
@@ -314,7 +435,7 @@ def show_ticket_quiz_page():
 def show_ticket_results_page():
     """Display results after completing the exit ticket"""
     ticket_data = st.session_state.ticket_data
-    questions = ticket_data['questions']
+    questions = st.session_state.ticket_questions
     user_answers = st.session_state.ticket_user_answers
     question_flags = st.session_state.get('ticket_question_flags', {})
     
@@ -331,15 +452,14 @@ def show_ticket_results_page():
     
     st.markdown("---")
     
-    # Calculate score using original indices
-    correct_count = 0
-    total_questions = len(questions)
-    
-    for question_data in questions:
-        original_index = question_data.get('original_index')
-        if original_index is not None and original_index in user_answers:
-            if user_answers[original_index] == question_data['correct_answer']:
-                correct_count += 1
+    # Calculate score once using original indices - answers are locked by now
+    if st.session_state.get('ticket_score') is None:
+        correct_count = sum(
+            1 for question in questions
+            if user_answers.get(question.original_index) == question.correct_answer
+        )
+        st.session_state.ticket_score = (correct_count, len(questions))
+    correct_count, total_questions = st.session_state.ticket_score
     
     score_percentage = (correct_count / total_questions) * 100
     
@@ -374,11 +494,14 @@ def show_ticket_results_page():
                     st.session_state.get('student_name', 'Unknown'),
                     user_answers,  # This now contains original indices as keys
                     score_data,
-                    question_flags  # This now contains original indices as keys
+                    question_flags,  # This now contains original indices as keys
+                    ticket_data,
+                    variant_records(questions)  # Exact variant of each templated question
                 )
                 
                 if success:
                     st.session_state.response_saved = True
+                    clear_session_checkpoint(db, ticket_data['ticket_id'], st.session_state.get('student_name', 'Unknown'))
                     st.success("✅ Your response has been recorded!")
                 else:
                     st.error("❌ You have already completed this exit ticket!")
@@ -404,61 +527,68 @@ def show_ticket_results_page():
     # Detailed review - MAINTAIN ORIGINAL ORDER
     st.subheader("📝 Detailed Review")
     
-    for i, question_data in enumerate(questions):
-        original_index = question_data.get('original_index')
+    for i, question in enumerate(questions):
+        original_index = question.original_index
         flag_status = " 🚩" if question_flags.get(original_index, False) else ""
-        with st.expander(f"Question {i + 1}: {question_data['question'][:50]}...{flag_status}"):
-            st.markdown(f"**Question:** {question_data['question']}")
+        with st.expander(f"Question {i + 1}: {question.summary_label}{flag_status}"):
+            st.markdown(f"**Question:** {question.text}")
             
             # Show flag status using original index
             if question_flags.get(original_index, False):
                 st.warning("🚩 **You flagged this question** as unclear or out of syllabus")
             
-            user_answer = user_answers.get(original_index, "NA")
-            correct_answer = question_data['correct_answer']
+            user_position = question.option_positions.get(user_answers.get(original_index))
+            correct_position = question.correct_position
             
             # Show all options in A, B, C, D order
             st.markdown("**All Options:**")
-            option_keys = ['A', 'B', 'C', 'D']
-            for opt_key in option_keys:
-                if opt_key in question_data['options']:
-                    option_text = question_data['options'][opt_key]
-                    if opt_key == user_answer and opt_key == correct_answer:
-                        st.success(f"✅ {opt_key}) {option_text} (Your answer - Correct)")
-                    elif opt_key == user_answer:
-                        st.error(f"❌ {opt_key}) {option_text} (Your answer - Incorrect)")
-                    elif opt_key == correct_answer:
-                        st.success(f"✅ {opt_key}) {option_text} (Correct answer)")
-                    else:
-                        st.markdown(f"{opt_key}) {option_text}")
+            for position, option_label in enumerate(question.option_labels):
+                if position == user_position and position == correct_position:
+                    st.success(f"✅ {option_label} (Your answer - Correct)")
+                elif position == user_position:
+                    st.error(f"❌ {option_label} (Your answer - Incorrect)")
+                elif position == correct_position:
+                    st.success(f"✅ {option_label} (Correct answer)")
+                else:
+                    st.markdown(option_label)
             
-            st.info(f"**Explanation:** {question_data.get('explanation', 'No explanation provided.')}")
-            st.markdown(f"**Topic:** {question_data.get('topic', 'Unknown')}")
-            st.markdown(f"**Subtopic:** {question_data.get('subtopic', 'Unknown')}")
+            # Generated explanations are shared per question, so never for a student's own variant
+            if question.explanation or question.variant or not ticket_data.get('lazy_explanations'):
+                st.info(f"**Explanation:** {question.explanation or 'No explanation provided.'}")
+            else:
+                show_lazy_explanation(ticket_data['ticket_id'], question)
+            st.markdown(f"**Topic:** {question.topic}")
+            st.markdown(f"**Subtopic:** {question.subtopic}")
     
     # Action buttons
     col1, col2 = st.columns([1, 1])
     
     with col1:
         if st.button("🔄 Take Another Exit Ticket"):
-            # MODIFIED: Reset ticket session state INCLUDING submission tracking
-            st.session_state.ticket_data = None
-            st.session_state.ticket_current_question = 0
-            st.session_state.ticket_user_answers = {}
-            st.session_state.ticket_quiz_completed = False
-            st.session_state.ticket_show_feedback = False
-            st.session_state.ticket_last_user_answer = None
-            st.session_state.student_name = None
-            st.session_state.response_saved = False
-            st.session_state.student_already_attempted = False
-            st.session_state.ticket_question_flags = {}  # Reset flags
-            st.session_state.ticket_question_submitted = {}  # ADD: Reset submission tracking
-            if 'ticket_initialized' in st.session_state:
-                del st.session_state.ticket_initialized
+            # MODIFIED: Reset every quiz key, including submission tracking and flags
+            reset_quiz_state(st.session_state)
             st.rerun()
     with col2:
         st.markdown("**Need help?**")
         st.markdown("Contact your teacher if you have any questions.")
 
+def show_lazy_explanation(ticket_id, question):
+    """Explanation generated the first time any student asks for it, then shared"""
+    explanations = st.session_state.ticket_explanations
+    original_index = question.original_index
+
+    if original_index not in explanations:
+        if not st.button("💡 Show explanation", key=f"explain_{original_index}"):
+            return
+        from explanations import get_explanation
+        with st.spinner("Preparing explanation..."):
+            explanation = get_explanation(db, ticket_id, question)
+        if not explanation:
+            st.warning("The explanation isn't available right now. Please try again in a moment.")
+            return
+        explanations[original_index] = explanation
+
+    st.info(f"**Explanation:** {explanations[original_index]}")
+
 if __name__ == "__main__":
     main()
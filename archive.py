@@ -0,0 +1,318 @@
+"""
+Cold storage for student responses of expired tickets.
+
+Responses are moved out of Firestore into one gzip-compressed columnar
+JSON file per ticket, partitioned by teacher and term:
+
+    <teacher>/<term>/<ticket_id>.json.gz
+
+A tombstone is left in ticket_archives and on the ticket itself, and the
+firebase_helper read functions merge archived rows back in transparently.
+A hot row for a (ticket, student) pair that is also in the archive was
+left behind by an interrupted run and is skipped, so it is never counted
+twice; the next run deletes it and marks the ticket archive_complete.
+Hot rows saved after archiving (a ticket set back to active) are kept.
+Usage:
+
+    python archive.py --older-than-days 120 [--dry-run]
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from config import ARCHIVE_BACKEND, ARCHIVE_DIR, ARCHIVE_BUCKET
+
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+
+# Archive files are immutable, so decoded ones can be kept in memory
+ARCHIVE_READ_CACHE_SIZE = 64
+
+RESPONSE_COLUMNS = ('ticket_id', 'student_name', 'responses', 'score', 'flags', 'completed_at', 'variants')
+
+
+class LocalArchiveStore:
+    """Archive files in a local directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def write(self, path, data):
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+
+    def read(self, path):
+        full_path = os.path.join(self.root, path)
+        if not os.path.exists(full_path):
+            return None
+        with open(full_path, 'rb') as f:
+            return f.read()
+
+
+class GCSArchiveStore:
+    """Archive files in a Cloud Storage bucket of the Firebase project"""
+
+    def __init__(self, bucket_name=None):
+        from firebase_admin import storage
+        self.bucket = storage.bucket(bucket_name or None)
+
+    def write(self, path, data):
+        self.bucket.blob(path).upload_from_string(data, content_type='application/gzip')
+
+    def read(self, path):
+        blob = self.bucket.blob(path)
+        if not blob.exists():
+            return None
+        return blob.download_as_bytes()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_archive_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = GCSArchiveStore(ARCHIVE_BUCKET) if ARCHIVE_BACKEND == "gcs" else LocalArchiveStore(ARCHIVE_DIR)
+    return _store
+
+
+def _slug(value):
+    return re.sub(r'[^a-z0-9]+', '-', str(value or 'unknown').lower()).strip('-') or 'unknown'
+
+
+def term_for(when):
+    """Academic term label, e.g. 2024-S1 for January-June"""
+    if not isinstance(when, datetime):
+        return 'unknown'
+    return f"{when.year}-S{1 if when.month <= 6 else 2}"
+
+
+def archive_path(ticket_data):
+    return f"{_slug(ticket_data.get('teacher_name'))}/{term_for(ticket_data.get('created_at'))}/{ticket_data['ticket_id']}.json.gz"
+
+
+def encode_responses(rows):
+    """Encode response dicts column-wise and gzip them"""
+    columns = {}
+    for column in RESPONSE_COLUMNS:
+        values = [row.get(column) for row in rows]
+        if column == 'completed_at':
+            values = [v.isoformat() if isinstance(v, datetime) else None for v in values]
+        columns[column] = values
+    payload = {'version': 1, 'rows': len(rows), 'columns': columns}
+    return gzip.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_responses(data):
+    """Inverse of encode_responses"""
+    payload = json.loads(gzip.decompress(data).decode('utf-8'))
+    columns = payload['columns']
+    rows = []
+    for i in range(payload['rows']):
+        # Older archives predate some columns
+        row = {column: columns[column][i] if column in columns else None for column in RESPONSE_COLUMNS}
+        if row['completed_at']:
+            row['completed_at'] = datetime.fromisoformat(row['completed_at'])
+        rows.append(row)
+    return rows
+
+
+_read_cache = OrderedDict()
+_read_lock = threading.Lock()
+
+
+def read_archived_responses(ticket_data):
+    """
+    Responses of an archived ticket, or [] if the ticket was never archived
+
+    Args:
+        ticket_data: Ticket dict; archived tickets carry archive_path
+    """
+    path = (ticket_data or {}).get('archive_path')
+    if not path:
+        return []
+
+    with _read_lock:
+        if path in _read_cache:
+            _read_cache.move_to_end(path)
+            return [dict(row) for row in _read_cache[path]]
+
+    data = get_archive_store().read(path)
+    if data is None:
+        print(f"Archive file missing: {path}")
+        return []
+    rows = decode_responses(data)
+
+    with _read_lock:
+        _read_cache[path] = rows
+        while len(_read_cache) > ARCHIVE_READ_CACHE_SIZE:
+            _read_cache.popitem(last=False)
+    return [dict(row) for row in rows]
+
+
+def response_key(response_data):
+    """A student answers a ticket once, so this identifies a response in hot and cold storage"""
+    return response_data.get('ticket_id'), response_data.get('student_name')
+
+
+def merge_responses(hot_rows, archived_rows):
+    """
+    Combine Firestore and archived responses, dropping hot rows that are
+    leftover copies of archived ones
+    """
+    archived_keys = {response_key(row) for row in archived_rows}
+    return list(archived_rows) + [row for row in hot_rows if response_key(row) not in archived_keys]
+
+
+def archive_ticket(db, store, ticket_data, dry_run=False):
+    """
+    Move one ticket's responses to the archive store
+
+    Returns:
+        int: Number of responses archived
+    """
+    from firebase_admin import firestore
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from firebase_helper import summary_doc_id, invalidate_ticket_cache
+
+    ticket_id = ticket_data['ticket_id']
+    docs = list(db.collection("student_responses")
+                  .where(filter=FieldFilter("ticket_id", "==", ticket_id))
+                  .stream())
+    rows = [doc.to_dict() for doc in docs]
+    path = archive_path(ticket_data)
+    if dry_run:
+        print(f"[dry run] {ticket_id}: {len(rows)} responses -> {path}")
+        return len(rows)
+
+    data = encode_responses(rows)
+    store.write(path, data)
+    # Never delete hot data unless the cold copy reads back intact
+    stored = store.read(path)
+    if stored is None or len(decode_responses(stored)) != len(rows):
+        raise IOError(f"Archive verification failed for {path}")
+
+    percentages = [(row.get('score') or {}).get('percentage', 0) for row in rows]
+    tombstone = {
+        'ticket_id': ticket_id,
+        'teacher_name': ticket_data.get('teacher_name'),
+        'term': term_for(ticket_data.get('created_at')),
+        'archive_path': path,
+        'response_count': len(rows),
+        'average_percentage': sum(percentages) / len(percentages) if percentages else 0,
+        'flag_count': sum(len([f for f in (row.get('flags') or {}).values() if f]) for row in rows),
+        'archived_at': firestore.SERVER_TIMESTAMP,
+    }
+    db.collection("ticket_archives").document(ticket_id).set(tombstone)
+    db.collection("tickets").document(ticket_id).update({
+        'archive_path': path,
+        'archived_at': firestore.SERVER_TIMESTAMP,
+    })
+    invalidate_ticket_cache(ticket_id)
+
+    # Let each student's history find this ticket in the archive
+    students = sorted({row['student_name'] for row in rows if row.get('student_name')})
+    for start in range(0, len(students), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for student_name in students[start:start + MAX_BATCH_WRITES]:
+            doc_ref = db.collection("student_summaries").document(summary_doc_id(student_name))
+            batch.set(doc_ref, {'archived_tickets': firestore.ArrayUnion([ticket_id])}, merge=True)
+        batch.commit()
+
+    delete_hot_responses(db, ticket_id, docs)
+    return len(rows)
+
+
+def delete_hot_responses(db, ticket_id, docs=None):
+    """
+    Delete the Firestore copies of an archived ticket's responses, then mark
+    the archive complete. Safe to repeat after a partial failure.
+
+    Returns:
+        int: Number of documents deleted
+    """
+    from firebase_admin import firestore
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from firebase_helper import invalidate_ticket_cache
+
+    if docs is None:
+        docs = list(db.collection("student_responses")
+                      .where(filter=FieldFilter("ticket_id", "==", ticket_id))
+                      .stream())
+
+    for start in range(0, len(docs), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for doc in docs[start:start + MAX_BATCH_WRITES]:
+            batch.delete(doc.reference)
+        batch.commit()
+
+    db.collection("tickets").document(ticket_id).update({
+        'archive_complete': True,
+        'archive_completed_at': firestore.SERVER_TIMESTAMP,
+    })
+    invalidate_ticket_cache(ticket_id)
+    return len(docs)
+
+
+def archive_expired_tickets(db, store, cutoff, dry_run=False):
+    """
+    Archive responses of every expired ticket created before cutoff
+
+    Returns:
+        dict: ticket_id -> number of responses archived
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    tickets = [doc.to_dict() for doc in db.collection("tickets")
+               .where(filter=FieldFilter("status", "==", "expired"))
+               .stream()]
+
+    archived = {}
+    for ticket_data in tickets:
+        if ticket_data.get('archive_path'):
+            if not ticket_data.get('archive_complete') and not dry_run:
+                # An earlier run stopped before all hot rows were deleted
+                try:
+                    deleted = delete_hot_responses(db, ticket_data['ticket_id'])
+                    print(f"Finished archiving {ticket_data['ticket_id']}: deleted {deleted} leftover responses")
+                except Exception as e:
+                    print(f"Error finishing archive of ticket {ticket_data.get('ticket_id')}: {e}")
+            continue
+
+        created_at = ticket_data.get('created_at')
+        if not isinstance(created_at, datetime) or created_at >= cutoff:
+            continue
+        try:
+            archived[ticket_data['ticket_id']] = archive_ticket(db, store, ticket_data, dry_run)
+        except Exception as e:
+            print(f"Error archiving ticket {ticket_data.get('ticket_id')}: {e}")
+    return archived
+
+
+def main():
+    from firebase_helper import init_firestore
+
+    parser = argparse.ArgumentParser(description="Archive responses of old expired tickets")
+    parser.add_argument("--older-than-days", type=int, default=120, help="Only archive tickets created before this many days ago")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be archived without changing anything")
+    args = parser.parse_args()
+
+    db = init_firestore()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    archived = archive_expired_tickets(db, get_archive_store(), cutoff, args.dry_run)
+    print(f"Archived {sum(archived.values())} responses from {len(archived)} tickets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Build student_summaries documents from existing student_responses and
+the archived responses of tickets moved to cold storage by archive.py.
+
+Summaries are rebuilt from scratch and overwrite existing ones, so run this
+outside class time. Usage:
+
+    python backfill_student_summaries.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+
+from firebase_admin import firestore
+
+from archive import read_archived_responses, response_key
+from firebase_helper import init_firestore, get_exit_ticket, apply_response_to_summary, summary_doc_id
+
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+
+
+def stream_responses(db, batch_size):
+    """Yield every student response, reading the collection in pages"""
+    last_doc = None
+    while True:
+        query = db.collection("student_responses").order_by("__name__").limit(batch_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        docs = list(query.stream())
+        for doc in docs:
+            yield doc.to_dict()
+        if len(docs) < batch_size:
+            return
+        last_doc = docs[-1]
+
+
+def stream_archived_responses(db):
+    """Yield (ticket, responses) for every ticket with a tombstone in ticket_archives"""
+    for doc in db.collection("ticket_archives").stream():
+        ticket_data = get_exit_ticket(db, doc.id)
+        if ticket_data and ticket_data.get('archive_path'):
+            yield ticket_data, read_archived_responses(ticket_data)
+
+
+def build_summaries(db, batch_size):
+    """Fold all hot and archived responses into one summary per student"""
+    tickets = {}
+    summaries = {}
+    archived_keys = set()
+    count = 0
+
+    def all_responses():
+        for ticket_data, rows in stream_archived_responses(db):
+            tickets[ticket_data['ticket_id']] = ticket_data
+            archived_keys.update(response_key(row) for row in rows)
+            yield from rows
+        for response_data in stream_responses(db, batch_size):
+            # Hot copies of archived responses are left over from an interrupted archive run
+            if response_key(response_data) not in archived_keys:
+                yield response_data
+
+    for response_data in all_responses():
+        student_name = response_data.get('student_name')
+        ticket_id = response_data.get('ticket_id')
+        if not student_name or not ticket_id:
+            continue
+
+        if ticket_id not in tickets:
+            tickets[ticket_id] = get_exit_ticket(db, ticket_id)
+
+        doc_id = summary_doc_id(student_name)
+        summaries[doc_id] = apply_response_to_summary(summaries.get(doc_id), response_data, tickets[ticket_id])
+
+        count += 1
+        if count % batch_size == 0:
+            print(f"Processed {count} responses...")
+
+    print(f"Processed {count} responses for {len(summaries)} students")
+    return summaries
+
+
+def write_summaries(db, summaries, batch_size):
+    batch_size = min(batch_size, MAX_BATCH_WRITES)
+    items = list(summaries.items())
+    for start in range(0, len(items), batch_size):
+        batch = db.batch()
+        for doc_id, summary in items[start:start + batch_size]:
+            summary['updated_at'] = firestore.SERVER_TIMESTAMP
+            # Only replace the rebuilt fields; archived_tickets is maintained by archive.py
+            batch.set(db.collection("student_summaries").document(doc_id), summary, merge=list(summary))
+        batch.commit()
+        print(f"Wrote {min(start + batch_size, len(items))}/{len(items)} summaries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill student summary documents")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_WRITES, help="Responses read / summaries written per batch")
+    parser.add_argument("--dry-run", action="store_true", help="Build summaries without writing them")
+    args = parser.parse_args()
+
+    db = init_firestore()
+    summaries = build_summaries(db, args.batch_size)
+    if args.dry_run:
+        print("Dry run - nothing written")
+        return
+    write_summaries(db, summaries, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
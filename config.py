@@ -16,4 +16,72 @@ DEFAULT_QUESTIONS_COUNT = 3
 
 # UI Configuration
 QUESTION_HEIGHT = 100
-INSTRUCTIONS_HEIGHT = 70 
\ No newline at end of file
+INSTRUCTIONS_HEIGHT = 70 
+
+# Question Bank Index
+QUESTION_INDEX_PATH = os.getenv("QUESTION_INDEX_PATH", os.path.join("data", "question_index.json.gz"))
+
+# Admission Control
+FIRESTORE_MAX_CONCURRENT_CALLS = int(os.getenv("FIRESTORE_MAX_CONCURRENT_CALLS", "16"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "3"))
+ADMISSION_RETRY_AFTER_SECONDS = float(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+
+# Session Checkpoints ("sqlite" for single-node, "firestore" for multi-node, "none" to disable)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join("data", "sessions.sqlite3"))
+
+# Question Selection (tickets can override with a stratify_by_topic field)
+STRATIFY_QUESTION_SELECTION = os.getenv("STRATIFY_QUESTION_SELECTION", "false").lower() == "true"
+
+# Student Summaries
+SUMMARY_RECENT_ATTEMPTS = 10
+
+# Shared Cache ("sqlite" for single-node, "redis" for multi-node, "none" to disable)
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "sqlite")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join("data", "cache.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = "exit_ticket"
+# Short, because a ticket closed outside this app (e.g. the console) is only seen when its entry expires
+TICKET_CACHE_TTL = int(os.getenv("TICKET_CACHE_TTL", "30"))
+TICKET_NEGATIVE_CACHE_TTL = 60
+ATTEMPT_CACHE_TTL = 86400
+ATTEMPT_NEGATIVE_CACHE_TTL = 30
+
+# Ticket Pre-warming (uses the scheduled_open_at field on tickets)
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() == "true"
+PREWARM_LEAD_SECONDS = int(os.getenv("PREWARM_LEAD_SECONDS", "300"))
+PREWARM_POLL_SECONDS = int(os.getenv("PREWARM_POLL_SECONDS", "60"))
+
+# Rerun Profiling (admins can also enable it per session with ?profile=<PROFILE_ADMIN_TOKEN>)
+PROFILE_RERUNS = os.getenv("PROFILE_RERUNS", "false").lower() == "true"
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_KEEP_SLOWEST = int(os.getenv("PROFILE_KEEP_SLOWEST", "20"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+
+# Session Lifecycle
+SESSION_IDLE_EVICT_SECONDS = int(os.getenv("SESSION_IDLE_EVICT_SECONDS", "1800"))
+SESSION_REAPER_INTERVAL_SECONDS = int(os.getenv("SESSION_REAPER_INTERVAL_SECONDS", "60"))
+SESSION_MEMORY_TRACKING = os.getenv("SESSION_MEMORY_TRACKING", "false").lower() == "true"
+SESSION_MEMORY_GROWTH_ALERT_MB_PER_HOUR = float(os.getenv("SESSION_MEMORY_GROWTH_ALERT_MB_PER_HOUR", "50"))
+
+# Response Archive ("local" directory or "gcs" bucket of the Firebase project)
+ARCHIVE_BACKEND = os.getenv("ARCHIVE_BACKEND", "local")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join("data", "archive"))
+ARCHIVE_BUCKET = os.getenv("ARCHIVE_BUCKET", "")
+
+# Explanations (tickets with lazy_explanations are generated without them;
+# set EXPLANATION_GENERATOR=stub to work offline)
+EXPLANATION_MODEL = os.getenv("EXPLANATION_MODEL", "gemini-1.5-flash")
+EXPLANATION_GENERATOR = os.getenv("EXPLANATION_GENERATOR", "gemini")
+# One worker generates each explanation; the claim lapses after this long if that worker dies
+EXPLANATION_CLAIM_SECONDS = int(os.getenv("EXPLANATION_CLAIM_SECONDS", "60"))
+# Other workers poll the ticket for up to this long, then ask the student to try again
+EXPLANATION_WAIT_SECONDS = float(os.getenv("EXPLANATION_WAIT_SECONDS", "5"))
+EXPLANATION_POLL_SECONDS = float(os.getenv("EXPLANATION_POLL_SECONDS", "1"))
+
+# MCQ Generation (schema-constrained output, repaired locally; only
+# unrepairable questions are requested again, up to MCQ_MAX_REPAIR_ROUNDS calls)
+MCQ_MODEL = os.getenv("MCQ_MODEL", "gemini-1.5-flash")
+MCQ_MAX_REPAIR_ROUNDS = int(os.getenv("MCQ_MAX_REPAIR_ROUNDS", "3"))
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+from admission import SingleFlight
+from config import (
+    EXPLANATION_MODEL,
+    EXPLANATION_GENERATOR,
+    EXPLANATION_CLAIM_SECONDS,
+    EXPLANATION_WAIT_SECONDS,
+    EXPLANATION_POLL_SECONDS,
+)
+
+# Number of explanations kept per process; the ticket holds all of them
+EXPLANATION_CACHE_SIZE = 1024
+
+EXPLANATION_PROMPT = """You are an engineering tutor. Explain in 2-4 sentences why the correct answer
+to this multiple choice question is right and why the other options are wrong.
+
+Question: {question}
+Options:
+{options}
+Correct answer: {correct_answer}
+
+Reply with the explanation text only."""
+
+
+def gemini_explanation(question):
+    """Generate an explanation with the Gemini API"""
+    import google.generativeai as genai
+
+    prompt = EXPLANATION_PROMPT.format(
+        question=question.text,
+        options="\n".join(question.option_labels),
+        correct_answer=question.option_labels[question.correct_position],
+    )
+    response = genai.GenerativeModel(EXPLANATION_MODEL).generate_content(prompt)
+    return response.text.strip()
+
+
+def stub_explanation(question):
+    """Offline stand-in for development and tests - no model call"""
+    return f"The correct answer is {question.option_labels[question.correct_position]}."
+
+
+_generator = stub_explanation if EXPLANATION_GENERATOR == "stub" else gemini_explanation
+_inflight = SingleFlight()
+_explanations = OrderedDict()  # (ticket_id, original_index) -> text, least recently used first
+_lock = threading.Lock()
+
+
+def set_explanation_generator(generator):
+    """Replace the model call, e.g. with stub_explanation when working offline"""
+    global _generator
+    _generator = generator
+
+
+def _stored_explanation(db, ticket_id, original_index):
+    from firebase_helper import get_exit_ticket
+
+    ticket_data = get_exit_ticket(db, ticket_id) or {}
+    return (ticket_data.get('explanations') or {}).get(str(original_index))
+
+
+def _wait_for_other_worker(db, ticket_id, original_index):
+    """
+    Poll the ticket while another worker holds the claim. The wait is much
+    shorter than the claim so a student's script run is never tied up for
+    long; None if nothing was saved in time.
+    """
+    deadline = time.time() + EXPLANATION_WAIT_SECONDS
+    while time.time() < deadline:
+        time.sleep(EXPLANATION_POLL_SECONDS)
+        explanation = _stored_explanation(db, ticket_id, original_index)
+        if explanation:
+            return explanation
+    return None
+
+
+def _generate_and_store(db, ticket_id, question):
+    from firebase_helper import save_question_explanation
+    from shared_cache import get_shared_cache
+
+    # Another worker may have generated it while we waited for the single-flight slot
+    explanation = _stored_explanation(db, ticket_id, question.original_index)
+    if explanation:
+        return explanation
+
+    # SingleFlight only covers this process; the claim covers every worker
+    cache = get_shared_cache()
+    namespace, key = f"explanation:{ticket_id}", str(question.original_index)
+    if cache and not cache.claim(namespace, key, EXPLANATION_CLAIM_SECONDS):
+        # Still being generated, or its worker died and the claim has yet to lapse;
+        # either way a later request gets it
+        return _wait_for_other_worker(db, ticket_id, question.original_index)
+
+    try:
+        explanation = _generator(question)
+        save_question_explanation(db, ticket_id, question.original_index, explanation)
+    finally:
+        if cache:
+            cache.release(namespace, key)
+    return explanation
+
+
+def get_explanation(db, ticket_id, question):
+    """
+    Explanation for a compiled question, generated on first request.
+
+    Concurrent requests for the same question share one model call - within
+    a process through single-flight, across workers through a claim in the
+    shared cache - and the result is stored on the ticket, so every later
+    student reads it.
+
+    Returns:
+        str: Explanation text, or None if it failed or is still being generated elsewhere
+    """
+    if question.explanation:
+        return question.explanation
+
+    key = (ticket_id, question.original_index)
+    with _lock:
+        if key in _explanations:
+            _explanations.move_to_end(key)
+            return _explanations[key]
+
+    try:
+        explanation = _inflight.do(key, _generate_and_store, db, ticket_id, question)
+    except Exception as e:
+        print(f"Error generating explanation: {e}")
+        return None
+
+    if explanation:
+        with _lock:
+            _explanations[key] = explanation
+            while len(_explanations) > EXPLANATION_CACHE_SIZE:
+                _explanations.popitem(last=False)
+    return explanation
@@ -1,9 +1,13 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore_v1.base_query import FieldFilter  # Add this import
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
+from config import SUMMARY_RECENT_ATTEMPTS
+from session_store import student_doc_id
+from shared_cache import get_shared_cache
+from config import TICKET_CACHE_TTL, TICKET_NEGATIVE_CACHE_TTL, ATTEMPT_CACHE_TTL, ATTEMPT_NEGATIVE_CACHE_TTL
 
 def init_firestore():
     # Load environment variables
@@ -66,13 +70,26 @@ def get_exit_ticket(db, ticket_id):
     try:
         # Convert ticket_id to uppercase for consistency
         ticket_id = ticket_id.upper().strip()
+
+        cache = get_shared_cache()
+        if cache:
+            # Version taken before the read, so an invalidation during it is not overwritten
+            version = cache.version(f"ticket:{ticket_id}")
+            hit, ticket_data = cache.get(f"ticket:{ticket_id}", "data", version)
+            if hit:
+                return ticket_data
         
         doc = db.collection("tickets").document(ticket_id).get()
         
         if doc.exists:
             ticket_data = doc.to_dict()
+            if cache:
+                cache.set(f"ticket:{ticket_id}", "data", ticket_data, TICKET_CACHE_TTL, version)
             return ticket_data
         else:
+            # Negative cache so mistyped codes don't each cost a read
+            if cache:
+                cache.set(f"ticket:{ticket_id}", "data", None, TICKET_NEGATIVE_CACHE_TTL, version)
             return None
             
     except Exception as e:
@@ -101,6 +118,30 @@ def get_all_tickets_by_teacher(db, teacher_name):
         print(f"Error retrieving teacher's tickets: {e}")
         return []
 
+def get_tickets_created_since(db, since=None):
+    """
+    Get tickets created after a given time, oldest first
+
+    Args:
+        db: Firestore client
+        since: datetime of the last ticket already seen, or None for all tickets
+
+    Returns:
+        list: Ticket objects
+    """
+    try:
+        query = db.collection("tickets")
+        if since is not None:
+            query = query.where(filter=FieldFilter("created_at", ">", since))
+
+        tickets = [doc.to_dict() for doc in query.stream()]
+        tickets.sort(key=lambda x: x.get('created_at', datetime.min))
+        return tickets
+
+    except Exception as e:
+        print(f"Error retrieving new tickets: {e}")
+        return []
+
 # Alternative version if you want to try Firestore ordering (requires index)
 # def get_all_tickets_by_teacher_with_ordering(db, teacher_name):
 #     """
@@ -146,7 +187,8 @@ def update_ticket_status(db, ticket_id, status):
             "status": status,
             "updated_at": datetime.now()
         })
-        
+
+        invalidate_ticket_cache(ticket_id)
         return True
         
     except Exception as e:
@@ -154,8 +196,92 @@ def update_ticket_status(db, ticket_id, status):
         return False
 
 
-def save_student_response(db, ticket_id, student_name, responses, score, flags=None):
-    """Save student response with flag data"""
+def schedule_ticket_open(db, ticket_id, open_at):
+    """
+    Set when a ticket will be used in class so it can be pre-warmed
+
+    Args:
+        db: Firestore client
+        ticket_id: Unique ticket identifier
+        open_at: Timezone-aware datetime the teacher will read out the code
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        ticket_id = ticket_id.upper().strip()
+
+        db.collection("tickets").document(ticket_id).update({
+            "scheduled_open_at": open_at,
+            "updated_at": datetime.now()
+        })
+
+        invalidate_ticket_cache(ticket_id)
+        return True
+
+    except Exception as e:
+        print(f"Error scheduling ticket: {e}")
+        return False
+
+def get_tickets_opening_between(db, start, end):
+    """
+    Get tickets whose scheduled_open_at falls in [start, end)
+
+    Returns:
+        list: Ticket objects
+    """
+    try:
+        tickets_ref = db.collection("tickets") \
+                       .where(filter=FieldFilter("scheduled_open_at", ">=", start)) \
+                       .where(filter=FieldFilter("scheduled_open_at", "<", end)) \
+                       .stream()
+
+        return [doc.to_dict() for doc in tickets_ref]
+
+    except Exception as e:
+        print(f"Error retrieving scheduled tickets: {e}")
+        return []
+
+
+def save_question_explanation(db, ticket_id, question_index, explanation):
+    """
+    Store a lazily generated explanation on the ticket, keyed by the
+    question's original index
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        ticket_id = ticket_id.upper().strip()
+
+        # Nested merge touches only this question's entry
+        db.collection("tickets").document(ticket_id).set({
+            "explanations": {str(question_index): explanation}
+        }, merge=True)
+
+        invalidate_ticket_cache(ticket_id)
+        return True
+
+    except Exception as e:
+        print(f"Error saving explanation: {e}")
+        return False
+
+
+def invalidate_ticket_cache(ticket_id):
+    """Drop cached copies of a ticket on every worker after it changes"""
+    cache = get_shared_cache()
+    if cache:
+        cache.invalidate(f"ticket:{ticket_id.upper().strip()}")
+
+
+def save_student_response(db, ticket_id, student_name, responses, score, flags=None, ticket_data=None, variants=None):
+    """
+    Save student response with flag data and update the student's summary
+
+    Args:
+        ticket_data: Ticket shown to the student; used for per-topic stats in the summary
+        variants: Templated questions as instantiated for this student, keyed by original index
+    """
     try:
         # Check if student has already attempted this ticket
         existing_response = db.collection('student_responses').where(
@@ -176,9 +302,23 @@ def save_student_response(db, ticket_id, student_name, responses, score, flags=N
             'flags': {str(k): v for k, v in (flags or {}).items()},  # Save flags
             'completed_at': firestore.SERVER_TIMESTAMP
         }
+        if variants:
+            response_data['variants'] = {str(k): v for k, v in variants.items()}
         
         # Save to Firestore
         db.collection('student_responses').add(response_data)
+
+        # Write through so every worker sees the attempt immediately
+        cache = get_shared_cache()
+        if cache:
+            cache.set(f"attempt:{ticket_id.upper().strip()}", student_name.strip(), True, ATTEMPT_CACHE_TTL)
+
+        # The summary is derived data - a failure here must not lose the response
+        try:
+            update_student_summary(db, response_data, ticket_data)
+        except Exception as e:
+            print(f"Error updating student summary: {e}")
+
         return True
         
     except Exception as e:
@@ -187,9 +327,11 @@ def save_student_response(db, ticket_id, student_name, responses, score, flags=N
 
 def get_ticket_responses(db, ticket_id):
     """
-    Get all student responses for a specific ticket
+    Get all student responses for a specific ticket, including archived ones
     """
     try:
+        from archive import read_archived_responses, merge_responses
+
         ticket_id = ticket_id.upper().strip()
         
         # Updated syntax
@@ -201,6 +343,12 @@ def get_ticket_responses(db, ticket_id):
         for doc in responses_ref:
             response_data = doc.to_dict()
             responses.append(response_data)
+
+        # Archived tickets carry archive_path; the ticket itself comes from the cache.
+        # Hot rows also in the archive are leftovers of an interrupted run; newer ones are kept.
+        ticket_data = get_exit_ticket(db, ticket_id) or {}
+        if ticket_data.get('archive_path'):
+            responses = merge_responses(responses, read_archived_responses(ticket_data))
         
         responses.sort(key=lambda x: x.get('completed_at', datetime.min), reverse=True)
         return responses
@@ -211,9 +359,11 @@ def get_ticket_responses(db, ticket_id):
 
 def get_student_response_history(db, student_name):
     """
-    Get all exit ticket responses by a specific student
+    Get all exit ticket responses by a specific student, including archived ones
     """
     try:
+        from archive import merge_responses
+
         student_name = student_name.strip()
         
         # Updated syntax
@@ -225,6 +375,8 @@ def get_student_response_history(db, student_name):
         for doc in responses_ref:
             response_data = doc.to_dict()
             responses.append(response_data)
+
+        responses = merge_responses(responses, get_archived_student_responses(db, student_name))
         
         responses.sort(key=lambda x: x.get('completed_at', datetime.min), reverse=True)
         return responses
@@ -234,6 +386,181 @@ def get_student_response_history(db, student_name):
         return []
 
 
+def get_archived_student_responses(db, student_name):
+    """
+    A student's responses in the archive, newest first. The summary lists
+    which archived tickets hold them, so only those files are read.
+    """
+    from archive import read_archived_responses
+
+    student_name = student_name.strip()
+    summary = get_student_summary(db, student_name) or {}
+    responses = []
+    for archived_ticket_id in summary.get('archived_tickets', []):
+        archived = read_archived_responses(get_exit_ticket(db, archived_ticket_id))
+        responses.extend(r for r in archived if r.get('student_name') == student_name)
+    responses.sort(key=lambda x: x.get('completed_at') or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+    return responses
+
+def summary_doc_id(student_name):
+    """Document ID of a student's summary (case and spacing insensitive)"""
+    return student_doc_id(student_name)
+
+def apply_response_to_summary(summary, response_data, ticket_data=None):
+    """
+    Fold one student response into a summary dict
+
+    Args:
+        summary: Existing summary dict, or None to start a new one
+        response_data: Document from student_responses
+        ticket_data: Ticket the response belongs to, if available
+
+    Returns:
+        dict: Updated summary
+    """
+    # Fill missing fields too - archive.py can create a summary holding only archived_tickets
+    summary = summary or {}
+    for key, default in (('student_name', response_data.get('student_name', '')), ('attempt_count', 0),
+                         ('flag_count', 0), ('recent_attempts', []), ('subjects', {}), ('topics', {})):
+        summary.setdefault(key, default)
+    ticket_data = ticket_data or {}
+    score = response_data.get('score') or {}
+    flags = response_data.get('flags') or {}
+    flag_count = len([f for f in flags.values() if f])
+
+    completed_at = response_data.get('completed_at')
+    if not isinstance(completed_at, datetime):
+        # SERVER_TIMESTAMP sentinels cannot be stored inside arrays
+        completed_at = datetime.now(timezone.utc)
+
+    summary['attempt_count'] += 1
+    summary['flag_count'] += flag_count
+
+    attempt = {
+        'ticket_id': response_data.get('ticket_id'),
+        'title': ticket_data.get('title', ''),
+        'subject': ticket_data.get('subject', ''),
+        'correct_count': score.get('correct_count', 0),
+        'total_questions': score.get('total_questions', 0),
+        'percentage': score.get('percentage', 0),
+        'flag_count': flag_count,
+        'completed_at': completed_at,
+    }
+    recent = [attempt] + summary['recent_attempts']
+    recent.sort(key=lambda x: x['completed_at'], reverse=True)
+    summary['recent_attempts'] = recent[:SUMMARY_RECENT_ATTEMPTS]
+
+    subject = ticket_data.get('subject') or 'Unknown'
+    subject_stats = summary['subjects'].setdefault(subject, {'attempts': 0, 'percentage_sum': 0})
+    subject_stats['attempts'] += 1
+    subject_stats['percentage_sum'] += score.get('percentage', 0)
+    subject_stats['average'] = subject_stats['percentage_sum'] / subject_stats['attempts']
+
+    # Per-topic accuracy, matching answers to questions by original index
+    responses = response_data.get('responses') or {}
+    variants = response_data.get('variants') or {}
+    for i, question in enumerate(ticket_data.get('questions', [])):
+        key = str(question.get('original_index', i))
+        if key not in responses:
+            continue
+        topic = question.get('topic') or 'Unknown'
+        topic_stats = summary['topics'].setdefault(topic, {'answered': 0, 'correct': 0})
+        topic_stats['answered'] += 1
+        # Templated questions have a per-student answer recorded with the response
+        correct_answer = (variants.get(key) or question).get('correct_answer')
+        if responses[key] == correct_answer:
+            topic_stats['correct'] += 1
+        topic_stats['accuracy'] = topic_stats['correct'] / topic_stats['answered'] * 100
+
+    return summary
+
+def update_student_summary(db, response_data, ticket_data=None):
+    """Add a saved response to the student's summary document in a transaction"""
+    doc_ref = db.collection("student_summaries").document(summary_doc_id(response_data['student_name']))
+    transaction = db.transaction()
+
+    @firestore.transactional
+    def update_in_transaction(transaction):
+        snapshot = doc_ref.get(transaction=transaction)
+        summary = apply_response_to_summary(snapshot.to_dict() if snapshot.exists else None, response_data, ticket_data)
+        summary['updated_at'] = firestore.SERVER_TIMESTAMP
+        transaction.set(doc_ref, summary)
+
+    update_in_transaction(transaction)
+
+def get_student_summary(db, student_name):
+    """
+    Get a student's summary: recent attempts, averages by subject/topic and flag counts.
+    A single document read regardless of how many tickets the student has taken.
+
+    Returns:
+        dict: Summary if found, None otherwise
+    """
+    try:
+        doc = db.collection("student_summaries").document(summary_doc_id(student_name)).get()
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"Error retrieving student summary: {e}")
+        return None
+
+def get_student_responses_page(db, student_name, page_size=10, start_after=None):
+    """
+    Get one page of a student's responses, newest first, for drilling into history.
+    Firestore responses come first, then archived ones - only old expired
+    tickets are archived, so those are the oldest.
+    Requires a composite index: 'student_name' (Ascending), 'completed_at' (Descending)
+
+    Args:
+        db: Firestore client
+        student_name: Name of the student
+        page_size: Number of responses per page
+        start_after: Cursor returned by the previous call, or None for the first page
+
+    Returns:
+        tuple: (list of responses, cursor for the next page or None)
+    """
+    try:
+        from archive import response_key
+
+        student_name = student_name.strip()
+        cursor = start_after or {'hot': None, 'archive_offset': None}
+        archived = get_archived_student_responses(db, student_name)
+        responses = []
+
+        if cursor['archive_offset'] is None:
+            # Hot rows also in the archive are leftovers of an interrupted archive run
+            archived_keys = {response_key(row) for row in archived}
+            last_doc = cursor['hot']
+            while len(responses) < page_size:
+                wanted = page_size - len(responses)
+                query = db.collection("student_responses") \
+                          .where(filter=FieldFilter("student_name", "==", student_name)) \
+                          .order_by("completed_at", direction=firestore.Query.DESCENDING) \
+                          .limit(wanted)
+                if last_doc is not None:
+                    query = query.start_after(last_doc)
+
+                docs = list(query.stream())
+                responses.extend(r for r in (doc.to_dict() for doc in docs) if response_key(r) not in archived_keys)
+                if len(docs) < wanted:
+                    break  # No more hot responses
+                last_doc = docs[-1]
+            else:
+                return responses, {'hot': last_doc, 'archive_offset': None}
+            cursor = {'hot': None, 'archive_offset': 0}
+
+        # Fill the rest of the page from the archive
+        start = cursor['archive_offset']
+        end = start + page_size - len(responses)
+        responses.extend(archived[start:end])
+        next_cursor = {'hot': None, 'archive_offset': end} if end < len(archived) else None
+        return responses, next_cursor
+
+    except Exception as e:
+        print(f"Error retrieving student responses page: {e}")
+        return [], None
+
+
 
 def check_student_already_attempted(db, ticket_id, student_name):
     """
@@ -250,6 +577,13 @@ def check_student_already_attempted(db, ticket_id, student_name):
     try:
         ticket_id = ticket_id.upper().strip()
         student_name = student_name.strip()
+
+        cache = get_shared_cache()
+        if cache:
+            version = cache.version(f"attempt:{ticket_id}")
+            hit, attempted = cache.get(f"attempt:{ticket_id}", student_name, version)
+            if hit:
+                return attempted
         
         # Query for existing responses from this student for this ticket
         responses_ref = db.collection("student_responses") \
@@ -259,10 +593,22 @@ def check_student_already_attempted(db, ticket_id, student_name):
                          .stream()
         
         # Check if any document exists
-        for doc in responses_ref:
-            return True  # Student has already attempted
-        
-        return False  # Student hasn't attempted yet
+        attempted = any(True for _ in responses_ref)
+
+        if not attempted:
+            # An archived ticket set back to active must still recognise its earlier attempts
+            from archive import read_archived_responses
+
+            ticket_data = get_exit_ticket(db, ticket_id) or {}
+            if ticket_data.get('archive_path'):
+                attempted = any(r.get('student_name') == student_name for r in read_archived_responses(ticket_data))
+
+        if cache:
+            # "Not attempted" expires quickly in case the response was saved without the cache
+            ttl = ATTEMPT_CACHE_TTL if attempted else ATTEMPT_NEGATIVE_CACHE_TTL
+            cache.set(f"attempt:{ticket_id}", student_name, attempted, ttl, version)
+
+        return attempted
         
     except Exception as e:
         print(f"Error checking student attempt: {e}")
@@ -0,0 +1,375 @@
+"""
+MCQ generation with schema-constrained output and a local repair pass.
+
+The model is asked for JSON matching mcq_schema(), and every returned
+question is parsed, repaired and validated locally. Only the questions
+that cannot be repaired are requested again, instead of regenerating the
+whole quiz.
+
+To measure the repair rate against a corpus of raw model outputs
+(one JSON object per line with an "output" field and optionally the
+"expected" answer letters):
+
+    python mcq_generation.py --corpus mcq_repair_corpus.jsonl [--live 3]
+"""
+import argparse
+import json
+import re
+import time
+
+from config import MCQ_MODEL, MCQ_MAX_REPAIR_ROUNDS
+from ticket_compiler import OPTION_KEYS, validate_question
+
+_QUESTION_PROPERTIES = {
+    "question": {"type": "string"},
+    "options": {
+        "type": "object",
+        "properties": {key: {"type": "string"} for key in OPTION_KEYS},
+        "required": list(OPTION_KEYS),
+    },
+    "correct_answer": {"type": "string", "format": "enum", "enum": list(OPTION_KEYS)},
+    "explanation": {"type": "string"},
+    "topic": {"type": "string"},
+    "subtopic": {"type": "string"},
+}
+
+
+def mcq_schema(include_explanations=True):
+    """
+    Response schema for a list of questions, matching the fields the portal reads
+
+    Args:
+        include_explanations: False for lazy banks, whose explanations are generated on first review
+    """
+    properties = dict(_QUESTION_PROPERTIES)
+    if not include_explanations:
+        del properties["explanation"]
+    return {
+        "type": "array",
+        "items": {"type": "object", "properties": properties, "required": list(properties)},
+    }
+
+
+GENERATION_PROMPT = """You are an engineering lecturer writing an exit ticket.
+Write {count} multiple choice questions on the lecture topics below. Each question has
+exactly four options A, B, C and D with one correct answer, and a topic and subtopic
+taken from the lecture.{explanation_rule}
+
+Lecture topics:
+{topics}
+{instructions}"""
+
+
+def build_prompt(topics, count, instructions="", include_explanations=True):
+    return GENERATION_PROMPT.format(
+        count=count,
+        topics=topics,
+        instructions=f"\nAdditional instructions:\n{instructions}" if instructions else "",
+        explanation_rule=" Include a short explanation of the correct answer." if include_explanations else "",
+    )
+
+
+def gemini_generate(prompt, include_explanations=True):
+    """Call Gemini with JSON output constrained to the MCQ schema; returns the raw response text"""
+    import google.generativeai as genai
+
+    model = genai.GenerativeModel(MCQ_MODEL)
+    response = model.generate_content(
+        prompt,
+        generation_config=genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=mcq_schema(include_explanations),
+        ),
+    )
+    return response.text
+
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_OPTION_PREFIX = re.compile(r"^\s*\(?([A-Da-d])[\).:\-]\s+")
+# The whole answer must be a letter form: "b", "B)", "(B)", "Option B", "Answer: B"
+_ANSWER_LETTER = re.compile(r"^(?:option|answer)?\s*:?\s*\(?([A-Da-d])\)?[\).:]?$", re.IGNORECASE)
+
+
+def parse_model_output(text):
+    """
+    Extract the question list from a model reply, ignoring code fences and
+    any prose before or after the JSON
+
+    Returns:
+        list: Question objects as returned, or None if no JSON could be found
+    """
+    if not isinstance(text, str):
+        return None
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    decoder = json.JSONDecoder()
+    for start, char in enumerate(text):
+        if char not in "[{":
+            continue
+        try:
+            value, _ = decoder.raw_decode(text, start)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            value = value.get("questions", [value])
+        return value if isinstance(value, list) else None
+    return None
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+def _resolve_answer(answer, options, letter_map):
+    """
+    Option letter an answer refers to, after re-lettering
+
+    Returns:
+        tuple: (letter or None if the answer matches no option, whether it was given as text)
+    """
+    match = _ANSWER_LETTER.match(answer)
+    if match:
+        # A letter whose option was dropped matches nothing
+        return letter_map.get(match.group(1).upper()), False
+
+    by_text = [key for key, text in options.items() if text.lower() == answer.lower()]
+    if by_text:
+        return by_text[0], True
+
+    # "B) 8 ohm" - the letter and its own option text
+    prefixed = _OPTION_PREFIX.match(answer)
+    if prefixed:
+        letter = letter_map.get(prefixed.group(1).upper())
+        rest = answer[prefixed.end():].strip().lower()
+        if letter and options[letter].lower() == rest:
+            return letter, True
+    return None, False
+
+
+def repair_question(question_data):
+    """
+    Fix common faults in one generated question without another model call:
+    alias field names, options given as a list or with lowercase or
+    letter-prefixed entries, gaps in the option letters, and answers given
+    as "b", "B)", "Option B", "B) <option text>" or the option text. Answers
+    that match no option are cleared, so validation rejects them.
+
+    Returns:
+        tuple: (repaired question dict, list of fixes applied)
+    """
+    fixes = []
+    if not isinstance(question_data, dict):
+        return question_data, fixes
+    question = dict(question_data)
+
+    for alias, field in (("answer", "correct_answer"), ("correct", "correct_answer"),
+                         ("question_text", "question"), ("choices", "options")):
+        if alias in question and field not in question:
+            question[field] = question.pop(alias)
+            fixes.append(f"renamed {alias}")
+
+    options = question.get("options")
+    if isinstance(options, list):
+        options = {key: value for key, value in zip(OPTION_KEYS, options)}
+        fixes.append("options list")
+    if isinstance(options, dict):
+        cleaned = {}
+        for key, value in options.items():
+            text = _clean(value)
+            if _OPTION_PREFIX.match(text):
+                text = _OPTION_PREFIX.sub("", text, count=1)
+                fixes.append("option prefix")
+            letter = str(key).strip().strip(").").upper()
+            if letter != key:
+                fixes.append("option key case")
+            if text and letter in OPTION_KEYS:
+                cleaned[letter] = text
+        # Re-letter when an option is missing so the keys stay contiguous
+        present = [key for key in OPTION_KEYS if key in cleaned]
+        relettered = {new: cleaned[old] for new, old in zip(OPTION_KEYS, present)}
+        letter_map = {old: new for new, old in zip(OPTION_KEYS, present)}
+        if present != list(OPTION_KEYS[:len(present)]):
+            fixes.append("missing option")
+        options = relettered
+    else:
+        options, letter_map = {}, {}
+    question["options"] = options
+
+    answer = _clean(question.get("correct_answer"))
+    letter, from_text = _resolve_answer(answer, options, letter_map)
+    if letter is None:
+        # Clear it for validation to reject - guessing would corrupt the answer key,
+        # and a dropped letter like "C" could otherwise name a re-lettered option
+        question["correct_answer"] = None
+    else:
+        if from_text:
+            fixes.append("answer text")
+        if letter != question.get("correct_answer"):
+            fixes.append("answer key")
+        question["correct_answer"] = letter
+
+    for field in ("question", "explanation", "topic", "subtopic"):
+        if field in question:
+            question[field] = _clean(question[field])
+
+    return question, sorted(set(fixes))
+
+
+def repair_questions(raw_questions):
+    """
+    Repair and validate a list of generated questions
+
+    Returns:
+        tuple: (valid questions, unrepairable count, number of questions that needed a fix)
+    """
+    valid, rejected, repaired = [], 0, 0
+    for question_data in raw_questions or []:
+        question, fixes = repair_question(question_data)
+        if validate_question(question, len(valid)):
+            rejected += 1
+            continue
+        valid.append(question)
+        if fixes:
+            repaired += 1
+    return valid, rejected, repaired
+
+
+class GenerationReport:
+    """Counts and timings of one generate_mcqs call"""
+
+    def __init__(self):
+        self.rounds = 0
+        self.received = 0
+        self.repaired = 0
+        self.rejected = 0
+        self.latencies = []
+
+    def as_dict(self):
+        return {
+            'rounds': self.rounds,
+            'received': self.received,
+            'repaired': self.repaired,
+            'rejected': self.rejected,
+            'latency_seconds': [round(t, 3) for t in self.latencies],
+        }
+
+
+def generate_mcqs(topics, count, instructions="", include_explanations=True, generate=gemini_generate,
+                  max_rounds=MCQ_MAX_REPAIR_ROUNDS):
+    """
+    Generate a validated question bank. Faulty questions are repaired
+    locally; only the ones that cannot be repaired are requested again.
+
+    Args:
+        topics: Lecture topics summary
+        count: Number of questions wanted
+        instructions: Optional extra guidance for the model
+        include_explanations: False for lazy banks - set lazy_explanations on the ticket
+        generate: Callable(prompt, include_explanations) -> raw model text
+        max_rounds: Model calls allowed in total
+
+    Returns:
+        tuple: (list of valid question dicts, GenerationReport)
+    """
+    report = GenerationReport()
+    questions = []
+
+    while len(questions) < count and report.rounds < max_rounds:
+        missing = count - len(questions)
+        prompt = build_prompt(topics, missing, instructions, include_explanations)
+
+        started = time.perf_counter()
+        try:
+            raw = parse_model_output(generate(prompt, include_explanations))
+        except Exception as e:
+            print(f"Error generating questions: {e}")
+            raw = None
+        report.latencies.append(time.perf_counter() - started)
+        report.rounds += 1
+
+        if raw is None:
+            print("Model reply contained no question list")
+            continue
+
+        valid, rejected, repaired = repair_questions(raw)
+        report.received += len(raw)
+        report.repaired += repaired
+        report.rejected += rejected
+        questions.extend(valid[:missing])
+
+    if len(questions) < count:
+        print(f"Generated {len(questions)} of {count} questions after {report.rounds} attempts")
+    return questions, report
+
+
+def measure_corpus(path):
+    """
+    Run the parse/repair pass over a corpus of raw model outputs. Rows may
+    carry an "expected" list with the correct letter of each question, or
+    null where the question must be rejected; mismatches are counted as
+    wrong keys.
+
+    Returns:
+        dict: Question counts, repair and rejection rates, wrong keys and local processing time
+    """
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+
+    total = valid_count = repaired = rejected = unparseable = wrong_keys = 0
+    started = time.perf_counter()
+    for row in rows:
+        raw = parse_model_output(row["output"])
+        if raw is None:
+            unparseable += 1
+            raw = []
+        keys = []
+        for question_data in raw:
+            question, fixes = repair_question(question_data)
+            if validate_question(question, valid_count):
+                rejected += 1
+                keys.append(None)
+                continue
+            valid_count += 1
+            if fixes:
+                repaired += 1
+            keys.append(question["correct_answer"])
+        total += len(raw)
+        if "expected" in row and keys != row["expected"]:
+            wrong_keys += 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        'outputs': len(rows),
+        'unparseable_outputs': unparseable,
+        'questions': total,
+        'valid': valid_count,
+        'repaired': repaired,
+        'rejected': rejected,
+        'wrong_keys': wrong_keys,
+        'repair_rate': repaired / (repaired + rejected) if repaired + rejected else 1.0,
+        'ms_per_output': elapsed * 1000 / len(rows) if rows else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure MCQ repair rate and generation latency")
+    parser.add_argument("--corpus", required=True, help="JSONL file of raw model outputs")
+    parser.add_argument("--live", type=int, default=0, help="Also time this many live generations")
+    parser.add_argument("--topics", default="Ohm's law and series/parallel resistor circuits", help="Topics for live generations")
+    args = parser.parse_args()
+
+    print(json.dumps(measure_corpus(args.corpus), indent=2))
+
+    for i in range(args.live):
+        started = time.perf_counter()
+        questions, report = generate_mcqs(args.topics, 3)
+        print(f"Live run {i + 1}: {len(questions)} questions in {time.perf_counter() - started:.2f}s {report.as_dict()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+from session_store import normalize_student_name
+
+from config import (
+    DEFAULT_QUESTIONS_COUNT,
+    STRATIFY_QUESTION_SELECTION,
+    PREWARM_LEAD_SECONDS,
+    PREWARM_POLL_SECONDS,
+)
+
+
+def prewarm_ticket(db, ticket_id):
+    """
+    Get a ticket ready before students arrive: load it into the shared
+    cache, compile it, open this worker's Firestore channel and, if the
+    ticket has a roster, precompute every student's plan (selection and
+    template variants). Plans are computed by one worker and read by all.
+
+    Returns:
+        bool: True if the ticket exists
+    """
+    from firebase_helper import get_exit_ticket, ticket_exists
+    from shared_cache import get_shared_cache
+    from ticket_compiler import get_compiled_ticket
+
+    # Always a real read, so this worker's connection is warm even if another worker filled the cache
+    if not ticket_exists(db, ticket_id):
+        return False
+
+    ticket_data = get_exit_ticket(db, ticket_id)
+    if not ticket_data:
+        return False
+
+    # Validate and compile now rather than on the first student's request
+    compiled = get_compiled_ticket(ticket_data)
+
+    roster = ticket_data.get('roster') or []
+    cache = get_shared_cache()
+    # The first worker to get here computes the plans; the rest only warm themselves
+    if roster and cache and cache.claim(_namespace(compiled.ticket_id), "compute", PREWARM_LEAD_SECONDS):
+        precompute_student_plans(cache, compiled, ticket_data, roster)
+
+    return True
+
+
+def _namespace(ticket_id):
+    # Not the ticket:{id} namespace, whose version every stored explanation bumps
+    return f"plans:{ticket_id.upper().strip()}"
+
+
+def _plan_key(student_name):
+    return f"plan:{normalize_student_name(student_name)}"
+
+
+def precompute_student_plans(cache, compiled, ticket_data, roster):
+    """
+    Store each roster student's selected indices and template variants
+    under the bank version they were computed for, so editing the questions
+    makes load_student_plan ignore them. Template variants for the whole
+    class are computed in one vectorised pass.
+    """
+    from question_templates import CompiledTemplate, instantiate_for_class
+    from ticket_compiler import select_for_student
+
+    stratify = ticket_data.get('stratify_by_topic', STRATIFY_QUESTION_SELECTION)
+    class_variants = {
+        question.original_index: instantiate_for_class(question, compiled.ticket_id, roster, compiled.bank_version)
+        for question in compiled.questions if isinstance(question, CompiledTemplate)
+    }
+    for student_name in roster:
+        indices = select_for_student(compiled, ticket_data, student_name, DEFAULT_QUESTIONS_COUNT, stratify)
+        plan = {
+            'bank_version': compiled.bank_version,
+            'indices': indices,
+            'variants': {
+                str(index): class_variants[index][student_name]
+                for index in indices if student_name in class_variants.get(index, {})
+            },
+        }
+        cache.set(_namespace(compiled.ticket_id), _plan_key(student_name), plan, PREWARM_LEAD_SECONDS * 4)
+
+
+def load_student_plan(compiled, student_name):
+    """
+    Precomputed plan for a student, or None if there is none for this bank version
+
+    Returns:
+        dict: indices (selected original indices) and variants (by str(index))
+    """
+    from shared_cache import get_shared_cache
+
+    cache = get_shared_cache()
+    if not cache:
+        return None
+    hit, plan = cache.get(_namespace(compiled.ticket_id), _plan_key(student_name))
+    if not hit or not plan or plan.get('bank_version') != compiled.bank_version:
+        return None
+    return plan
+
+
+class TicketPrewarmer:
+    """
+    Background thread that pre-warms tickets shortly before their
+    scheduled_open_at. Every worker runs its own, so each one opens its
+    own Firestore channel ahead of the class.
+    """
+
+    def __init__(self, db, lead_seconds=PREWARM_LEAD_SECONDS, poll_seconds=PREWARM_POLL_SECONDS):
+        self.db = db
+        self.lead = timedelta(seconds=lead_seconds)
+        self.poll_seconds = poll_seconds
+        self._warmed = {}  # ticket_id -> scheduled_open_at it was warmed for
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ticket-prewarmer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """Pre-warm every ticket opening within the lead time; returns how many were warmed"""
+        from firebase_helper import get_tickets_opening_between
+
+        now = datetime.now(timezone.utc)
+        warmed = 0
+        for ticket_data in get_tickets_opening_between(self.db, now, now + self.lead):
+            ticket_id = ticket_data.get('ticket_id')
+            open_at = ticket_data.get('scheduled_open_at')
+            # Warm again if the teacher rescheduled
+            if not ticket_id or self._warmed.get(ticket_id) == open_at:
+                continue
+            try:
+                if prewarm_ticket(self.db, ticket_id):
+                    warmed += 1
+                self._warmed[ticket_id] = open_at
+            except Exception as e:
+                print(f"Error pre-warming ticket {ticket_id}: {e}")
+
+        # Forget tickets whose scheduled time has passed
+        self._warmed = {
+            tid: at for tid, at in self._warmed.items()
+            if not isinstance(at, datetime) or at >= now - self.lead
+        }
+        return warmed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error in ticket pre-warmer: {e}")
+            self._stop.wait(self.poll_seconds)
+
+
+_prewarmer = None
+_prewarmer_lock = threading.Lock()
+
+
+def start_prewarmer(db):
+    """Start this process's pre-warmer once; safe to call on every rerun"""
+    global _prewarmer
+    with _prewarmer_lock:
+        if _prewarmer is None:
+            _prewarmer = TicketPrewarmer(db)
+            _prewarmer.start()
+    return _prewarmer
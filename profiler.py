@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import (
+    PROFILE_RERUNS,
+    PROFILE_SAMPLE_INTERVAL_MS,
+    PROFILE_KEEP_SLOWEST,
+    PROFILE_SLOW_MS,
+    PROFILE_DIR,
+)
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval and counts
+    collapsed stacks ("outer;inner;innermost"), the input format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval, root_file=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_file = os.path.abspath(root_file) if root_file else None
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rerun-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []  # innermost frame first
+        outermost_root = None
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            if self.root_file and os.path.abspath(code.co_filename) == self.root_file:
+                outermost_root = len(stack)
+            frame = frame.f_back
+        # Drop Streamlit's runner frames above the app script so they don't bury the result
+        if outermost_root:
+            stack = stack[:outermost_root]
+        if stack:
+            self.counts[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+class SlowRerunBuffer:
+    """Keeps the N slowest profiled reruns of this process"""
+
+    def __init__(self, size):
+        self.size = size
+        self._heap = []  # min-heap on duration, so the fastest kept rerun is evicted first
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Returns True if the rerun made it into the buffer"""
+        entry = (record['duration_ms'], next(self._seq), record)
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+                return True
+            if entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+                return True
+        return False
+
+    def slowest(self):
+        with self._lock:
+            return [record for _, _, record in sorted(self._heap, reverse=True)]
+
+
+slow_reruns = SlowRerunBuffer(PROFILE_KEEP_SLOWEST)
+
+
+def format_collapsed(samples):
+    """Render sample counts as collapsed-stack lines"""
+    return "\n".join(f"{stack} {count}" for stack, count in sorted(samples.items())) + "\n"
+
+
+def dump_profile(record, directory=PROFILE_DIR):
+    """Write one rerun as a flamegraph-ready .folded file; returns its path"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = record['started_at'].strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{stamp}-{record['page']}-{record['duration_ms']:.0f}ms.folded")
+    with open(path, "w") as f:
+        f.write(format_collapsed(record['samples']))
+    return path
+
+
+@contextmanager
+def profile_rerun(page_name, enabled=PROFILE_RERUNS, root_file=None):
+    """
+    Profile one script run when enabled. Does nothing otherwise, so the
+    disabled cost is a single branch.
+
+    Args:
+        page_name: Page being rendered, recorded with the profile
+        enabled: Profile this run
+        root_file: Path of the app script; stacks are trimmed above it
+    """
+    if not enabled:
+        yield
+        return
+
+    interval = PROFILE_SAMPLE_INTERVAL_MS / 1000
+    sampler = StackSampler(threading.get_ident(), interval, root_file)
+    started_at = datetime.now()
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        yield
+    finally:
+        # Also runs when the script ends through st.rerun() / st.stop()
+        sampler.stop()
+        duration_ms = (time.perf_counter() - start) * 1000
+        record = {
+            'page': page_name,
+            'started_at': started_at,
+            'duration_ms': duration_ms,
+            'sample_interval_ms': PROFILE_SAMPLE_INTERVAL_MS,
+            'samples': dict(sampler.counts),
+        }
+        if slow_reruns.add(record) and duration_ms >= PROFILE_SLOW_MS:
+            try:
+                record['path'] = dump_profile(record)
+            except OSError as e:
+                print(f"Error writing rerun profile: {e}")
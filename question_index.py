@@ -0,0 +1,302 @@
+import argparse
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+
+from config import QUESTION_INDEX_PATH
+
+# Words too common in engineering MCQs to be useful as search terms
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "what", "which", "with",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens, dropping stopwords"""
+    if not text:
+        return []
+    return [t for t in TOKEN_PATTERN.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+def normalize_facet(value):
+    """Normalise a topic/subtopic value so facet lookups are case insensitive"""
+    return " ".join(str(value or "").lower().split())
+
+
+class QuestionIndex:
+    """
+    Local inverted index over the question bank.
+
+    Every indexed question gets an integer document id. Postings map a token
+    to the set of document ids containing it, and the topic/subtopic facets
+    map a normalised facet value to document ids the same way.
+    """
+
+    def __init__(self):
+        self.docs = []            # doc id -> question summary dict (None once removed)
+        self.postings = {}        # token -> set of doc ids
+        self.topics = {}          # normalised topic -> set of doc ids
+        self.subtopics = {}       # normalised subtopic -> set of doc ids
+        self.ticket_docs = {}     # ticket_id -> list of doc ids
+        self.last_synced = None   # created_at of the newest indexed ticket
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.ticket_docs.values())
+
+    def has_ticket(self, ticket_id):
+        return ticket_id in self.ticket_docs
+
+    def add_ticket(self, ticket_data):
+        """
+        Index every question of a ticket. Re-adding a ticket replaces its
+        previous entries, so this is safe to call again after an edit.
+
+        Args:
+            ticket_data: Ticket dict as stored in the tickets collection
+
+        Returns:
+            int: Number of questions indexed
+        """
+        ticket_id = ticket_data.get('ticket_id')
+        if not ticket_id:
+            return 0
+
+        self.remove_ticket(ticket_id)
+
+        doc_ids = []
+        for question_index, question_data in enumerate(ticket_data.get('questions', [])):
+            doc_id = len(self.docs)
+            self.docs.append({
+                'ticket_id': ticket_id,
+                'question_index': question_index,
+                # Templates are indexed by their stem
+                'question': question_data.get('question') or question_data.get('stem', ''),
+                'topic': question_data.get('topic', ''),
+                'subtopic': question_data.get('subtopic', ''),
+                'subject': ticket_data.get('subject', ''),
+                'teacher_name': ticket_data.get('teacher_name', ''),
+            })
+            doc_ids.append(doc_id)
+
+            text_parts = [
+                question_data.get('question') or question_data.get('stem', ''),
+                question_data.get('explanation', ''),
+                question_data.get('topic', ''),
+                question_data.get('subtopic', ''),
+            ]
+            text_parts.extend((question_data.get('options') or {}).values())
+            for token in set(tokenize(" ".join(str(p) for p in text_parts))):
+                self.postings.setdefault(token, set()).add(doc_id)
+
+            topic = normalize_facet(question_data.get('topic'))
+            if topic:
+                self.topics.setdefault(topic, set()).add(doc_id)
+            subtopic = normalize_facet(question_data.get('subtopic'))
+            if subtopic:
+                self.subtopics.setdefault(subtopic, set()).add(doc_id)
+
+        self.ticket_docs[ticket_id] = doc_ids
+
+        created_at = ticket_data.get('created_at')
+        if isinstance(created_at, datetime):
+            if self.last_synced is None or created_at > self.last_synced:
+                self.last_synced = created_at
+
+        return len(doc_ids)
+
+    def remove_ticket(self, ticket_id):
+        """Drop all questions of a ticket from the index"""
+        doc_ids = self.ticket_docs.pop(ticket_id, None)
+        if not doc_ids:
+            return
+
+        removed = set(doc_ids)
+        for table in (self.postings, self.topics, self.subtopics):
+            for key in list(table):
+                table[key] -= removed
+                if not table[key]:
+                    del table[key]
+        for doc_id in doc_ids:
+            self.docs[doc_id] = None
+
+    def search(self, query=None, topic=None, subtopic=None, teacher_name=None, limit=50):
+        """
+        Find questions matching all query tokens and the given facets
+
+        Args:
+            query: Free text; every token must appear in the question
+            topic: Restrict to this topic (case insensitive)
+            subtopic: Restrict to this subtopic (case insensitive)
+            teacher_name: Restrict to tickets created by this teacher
+            limit: Maximum number of results
+
+        Returns:
+            list: Question summaries with ticket_id and question_index
+        """
+        candidate_sets = []
+
+        for token in set(tokenize(query)):
+            candidate_sets.append(self.postings.get(token, set()))
+        if topic:
+            candidate_sets.append(self.topics.get(normalize_facet(topic), set()))
+        if subtopic:
+            candidate_sets.append(self.subtopics.get(normalize_facet(subtopic), set()))
+
+        if candidate_sets:
+            # Intersect starting from the smallest set
+            candidate_sets.sort(key=len)
+            matches = set(candidate_sets[0])
+            for doc_ids in candidate_sets[1:]:
+                matches &= doc_ids
+                if not matches:
+                    break
+        else:
+            matches = {doc_id for doc_ids in self.ticket_docs.values() for doc_id in doc_ids}
+
+        results = []
+        # Newest documents first; doc ids grow as tickets are indexed
+        for doc_id in sorted(matches, reverse=True):
+            doc = self.docs[doc_id]
+            if doc is None:
+                continue
+            if teacher_name and doc['teacher_name'] != teacher_name:
+                continue
+            results.append(dict(doc))
+            if len(results) >= limit:
+                break
+        return results
+
+    def facet_counts(self):
+        """Return question counts per topic and subtopic"""
+        return {
+            'topics': {key: len(ids) for key, ids in self.topics.items()},
+            'subtopics': {key: len(ids) for key, ids in self.subtopics.items()},
+        }
+
+    def save(self, path):
+        """
+        Persist the index as gzip-compressed JSON.
+
+        Removed documents are compacted away and postings are stored as
+        sorted delta-encoded id lists, which keeps the file small.
+        """
+        live_ids = [doc_id for doc_id, doc in enumerate(self.docs) if doc is not None]
+        remap = {old: new for new, old in enumerate(live_ids)}
+
+        def encode(ids):
+            ordered = sorted(remap[i] for i in ids)
+            return [ordered[0]] + [b - a for a, b in zip(ordered, ordered[1:])] if ordered else []
+
+        # Question summaries stored as rows under one shared field header
+        fields = ['ticket_id', 'question_index', 'question', 'topic', 'subtopic', 'subject', 'teacher_name']
+        payload = {
+            'version': 1,
+            'last_synced': self.last_synced.isoformat() if self.last_synced else None,
+            'fields': fields,
+            'docs': [[self.docs[i][f] for f in fields] for i in live_ids],
+            'postings': {token: encode(ids) for token, ids in self.postings.items()},
+            'topics': {key: encode(ids) for key, ids in self.topics.items()},
+            'subtopics': {key: encode(ids) for key, ids in self.subtopics.items()},
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save(); returns an empty index if the file is missing"""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading question index: {e}")
+            return index
+
+        def decode(deltas):
+            ids, total = set(), 0
+            for delta in deltas:
+                total += delta
+                ids.add(total)
+            return ids
+
+        fields = payload['fields']
+        index.docs = [dict(zip(fields, row)) for row in payload['docs']]
+        index.postings = {token: decode(d) for token, d in payload['postings'].items()}
+        index.topics = {key: decode(d) for key, d in payload['topics'].items()}
+        index.subtopics = {key: decode(d) for key, d in payload['subtopics'].items()}
+        for doc_id, doc in enumerate(index.docs):
+            index.ticket_docs.setdefault(doc['ticket_id'], []).append(doc_id)
+        if payload.get('last_synced'):
+            index.last_synced = datetime.fromisoformat(payload['last_synced'])
+        return index
+
+
+def sync_question_index(db, index, path=QUESTION_INDEX_PATH):
+    """
+    Index tickets created since the last sync and persist the result.
+
+    This is the only writer of the index file: run it on a schedule or
+    after saving a ticket (python question_index.py sync) rather than
+    editing the file from several processes.
+
+    Args:
+        db: Firestore client
+        index: QuestionIndex to update
+        path: File to save the index to afterwards (None to skip saving)
+
+    Returns:
+        int: Number of tickets newly indexed
+    """
+    from firebase_helper import get_tickets_created_since
+
+    added = 0
+    for ticket_data in get_tickets_created_since(db, index.last_synced):
+        if not index.has_ticket(ticket_data.get('ticket_id')):
+            index.add_ticket(ticket_data)
+            added += 1
+
+    if path and added:
+        index.save(path)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and search the local question bank index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("sync", help="Index tickets created since the last sync")
+    search_parser = subparsers.add_parser("search", help="Search indexed questions")
+    search_parser.add_argument("query", nargs="?", help="Words to search for")
+    search_parser.add_argument("--topic", help="Only questions with this topic")
+    search_parser.add_argument("--subtopic", help="Only questions with this subtopic")
+    search_parser.add_argument("--teacher", help="Only questions from this teacher's tickets")
+    search_parser.add_argument("--limit", type=int, default=20, help="Maximum number of results")
+    args = parser.parse_args()
+
+    index = QuestionIndex.load(QUESTION_INDEX_PATH)
+    if args.command == "sync":
+        from firebase_helper import init_firestore
+
+        added = sync_question_index(init_firestore(), index)
+        print(f"Indexed {added} new tickets ({len(index)} questions in total)")
+        return
+
+    for result in index.search(args.query, args.topic, args.subtopic, args.teacher, args.limit):
+        print(f"{result['ticket_id']} Q{result['question_index'] + 1} [{result['topic']} / {result['subtopic']}] {result['question']}")
+
+
+if __name__ == "__main__":
+    main()
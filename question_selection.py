@@ -0,0 +1,112 @@
+import hashlib
+import json
+import random
+
+from session_store import normalize_student_name
+
+
+def bank_version(ticket_data):
+    """
+    Version of a ticket's question bank. Uses an explicit bank_version field
+    when the ticket has one, otherwise a short hash of the question content,
+    so editing the questions changes every student's selection.
+    """
+    if ticket_data.get('bank_version'):
+        return str(ticket_data['bank_version'])
+
+    content = []
+    for q in ticket_data.get('questions', []):
+        if q.get('type') == 'template':
+            # Any change to the template changes every variant
+            content.append(['template', q.get('stem', ''), q.get('params'), q.get('answer', ''), q.get('distractors'),
+                            q.get('format', ''), q.get('topic', ''), q.get('subtopic', '')])
+        else:
+            content.append((q.get('question', ''), q.get('correct_answer', ''), q.get('topic', ''), q.get('subtopic', '')))
+    return hashlib.sha1(json.dumps(content).encode('utf-8')).hexdigest()[:12]
+
+
+def selection_seed(ticket_id, student_name, version, *extra):
+    """Stable 64-bit seed for a (ticket, student, bank version) triple"""
+    parts = [ticket_id.upper().strip(), normalize_student_name(student_name), str(version)]
+    parts.extend(str(e) for e in extra)
+    digest = hashlib.sha256("\x1f".join(parts).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def select_question_indices(ticket_id, student_name, questions, count, version, stratify=False):
+    """
+    Pick which questions a student sees. The result depends only on the
+    arguments, so any worker can recompute it without stored state.
+
+    Args:
+        ticket_id: Ticket code
+        student_name: Student name (case and spacing are ignored)
+        questions: Full question list of the ticket
+        count: Number of questions to select
+        version: Bank version from bank_version()
+        stratify: Spread picks across topic/subtopic groups
+
+    Returns:
+        list: Original indices of the selected questions, in display order
+    """
+    rng = random.Random(selection_seed(ticket_id, student_name, version))
+    count = min(count, len(questions))
+
+    if not stratify:
+        return rng.sample(range(len(questions)), count)
+
+    # Group by (topic, subtopic) in first-seen order so strata are stable
+    strata = {}
+    for i, question in enumerate(questions):
+        key = (question.get('topic', ''), question.get('subtopic', ''))
+        strata.setdefault(key, []).append(i)
+
+    groups = list(strata.values())
+    for group in groups:
+        rng.shuffle(group)
+    # Seeded per student, so which topic comes first varies between students rather than
+    # always being the first one in the bank; it is random, not coordinated across the class
+    rng.shuffle(groups)
+
+    selected = []
+    depth = 0
+    while len(selected) < count:
+        for group in groups:
+            if depth < len(group):
+                selected.append(group[depth])
+                if len(selected) == count:
+                    break
+        depth += 1
+    return selected
+
+
+def class_exposure_matrix(ticket_data, roster, count, stratify=False):
+    """
+    Precompute which questions every student on a roster will see
+
+    Args:
+        ticket_data: Ticket dict with its full question list
+        roster: List of student names
+        count: Questions per student
+        stratify: Same option as select_question_indices
+
+    Returns:
+        pandas.DataFrame: One row per student, one 0/1 column per question
+    """
+    import numpy as np
+    import pandas as pd
+
+    questions = ticket_data.get('questions', [])
+    version = bank_version(ticket_data)
+    ticket_id = ticket_data['ticket_id']
+
+    # Flatten every student's selection into coordinate arrays and fill the matrix in one scatter
+    rows, cols = [], []
+    for row, student_name in enumerate(roster):
+        indices = select_question_indices(ticket_id, student_name, questions, count, version, stratify)
+        rows.extend([row] * len(indices))
+        cols.extend(indices)
+
+    matrix = np.zeros((len(roster), len(questions)), dtype=np.uint8)
+    matrix[np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)] = 1
+    return pd.DataFrame(matrix, index=list(roster), columns=[f"Q{i + 1}" for i in range(len(questions))])
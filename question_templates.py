@@ -0,0 +1,405 @@
+"""
+Parametric question templates.
+
+A template is stored in the ticket like any other question, with
+type "template":
+
+    {
+        "type": "template",
+        "stem": "A {R} ohm resistor carries {I} A. What is the voltage across it?",
+        "params": {"R": {"min": 10, "max": 100, "step": 10},
+                   "I": {"values": [0.5, 1, 1.5, 2]}},
+        "answer": "R * I",
+        "distractors": ["R / I", "R + I", "answer * 2"],
+        "format": "{:.2f} V",
+        "explanation": "V = I x R = {I} x {R} = {answer}",
+        "topic": "...", "subtopic": "..."
+    }
+
+Each student gets their own variant from a deterministic seed, so a
+template costs no model calls and is stored once in the ticket.
+Expressions are evaluated by a small whitelisted evaluator, never eval()
+on untrusted text. Use {{ and }} for literal braces in the stem.
+
+A template is checked over its whole parameter domain when compiled (or a
+large sample of it, for big domains), so every student's variant can be
+built.
+"""
+import ast
+import itertools
+import math
+import operator
+import random
+from functools import reduce
+
+from question_selection import selection_seed
+
+OPTION_KEYS = ('A', 'B', 'C', 'D')
+
+MAX_EXPONENT = 100
+
+# Templates with more parameter combinations than this are checked on a sample
+DOMAIN_CHECK_LIMIT = 2000
+DOMAIN_CHECK_SAMPLES = 500
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPS = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+
+_MATH_FUNCTIONS = {
+    'sqrt': math.sqrt, 'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
+    'asin': math.asin, 'acos': math.acos, 'atan': math.atan,
+    'log': math.log, 'log10': math.log10, 'exp': math.exp,
+    'radians': math.radians, 'degrees': math.degrees,
+    'abs': abs, 'round': round, 'min': min, 'max': max,
+}
+_CONSTANTS = {'pi': math.pi, 'e': math.e}
+
+# Operations numpy computes bit-for-bit like Python floats; expressions using
+# anything else (sin, log, round...) are evaluated per student instead
+_EXACT_FUNCTIONS = {'sqrt', 'abs', 'min', 'max'}
+
+
+class TemplateError(ValueError):
+    """Raised for an invalid template or expression"""
+
+
+class SafeExpression:
+    """
+    Arithmetic expression over named parameters. Parsed and checked once;
+    only numbers, parameter names, arithmetic operators and a fixed set of
+    math functions are allowed.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        try:
+            self.tree = ast.parse(str(source), mode='eval').body
+        except SyntaxError as e:
+            raise TemplateError(f"Invalid expression {source!r}: {e.msg}")
+        self.names = set()
+        self.vectorizable = True
+        self._check(self.tree)
+
+    def _check(self, node):
+        if isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                raise TemplateError(f"Only numbers are allowed in {self.source!r}")
+        elif isinstance(node, ast.Name):
+            if node.id not in _CONSTANTS:
+                self.names.add(node.id)
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            if isinstance(node.op, ast.Pow) and not isinstance(node.right, ast.Constant):
+                # The exponent limit can only be checked per value
+                self.vectorizable = False
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+            self._check(node.operand)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _MATH_FUNCTIONS:
+            if node.keywords:
+                raise TemplateError(f"Keyword arguments are not allowed in {self.source!r}")
+            if node.func.id not in _EXACT_FUNCTIONS:
+                self.vectorizable = False
+            for arg in node.args:
+                self._check(arg)
+        else:
+            raise TemplateError(f"Unsupported syntax in {self.source!r}: {type(node).__name__}")
+
+    def evaluate(self, values, functions=None):
+        """
+        Evaluate with the given parameter values.
+
+        Args:
+            values: Parameter name -> number (or numpy array for batch evaluation)
+            functions: Optional replacement for the math functions, e.g. numpy ufuncs
+        """
+        return self._eval(self.tree, values, functions or _MATH_FUNCTIONS)
+
+    def _eval(self, node, values, functions):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id in values:
+                return values[node.id]
+            if node.id in _CONSTANTS:
+                return _CONSTANTS[node.id]
+            raise TemplateError(f"Unknown name {node.id!r} in {self.source!r}")
+        if isinstance(node, ast.BinOp):
+            left = self._eval(node.left, values, functions)
+            right = self._eval(node.right, values, functions)
+            if isinstance(node.op, ast.Pow) and isinstance(right, (int, float)) and abs(right) > MAX_EXPONENT:
+                raise TemplateError(f"Exponent too large in {self.source!r}")
+            return _BINARY_OPS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp):
+            return _UNARY_OPS[type(node.op)](self._eval(node.operand, values, functions))
+        args = [self._eval(arg, values, functions) for arg in node.args]
+        return functions[node.func.id](*args)
+
+
+def format_number(value):
+    """Compact display for parameter values: 2.0 -> 2, 0.30000000000000004 -> 0.3"""
+    return f"{value:.6g}"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _format(pattern, what, **values):
+    """str.format that reports template mistakes as TemplateError"""
+    try:
+        if what == 'format':
+            return pattern.format(values['value'])
+        return pattern.format(**values)
+    except (IndexError, KeyError, ValueError, TypeError, AttributeError) as e:
+        hint = " (use {{ and }} for literal braces)" if isinstance(e, IndexError) else ""
+        raise TemplateError(f"Invalid {what} {pattern!r}: {type(e).__name__} {e}{hint}")
+
+
+class CompiledTemplate:
+    """A validated template with its expressions parsed once"""
+
+    __slots__ = ('original_index', 'stem', 'params', 'answer', 'distractors', 'answer_format',
+                 'explanation', 'topic', 'subtopic')
+
+    def __init__(self, template, original_index):
+        self.original_index = original_index
+        self.stem = str(template.get('stem') or '').strip()
+        if not self.stem:
+            raise TemplateError("Template has no stem")
+
+        params = template.get('params')
+        if not isinstance(params, dict) or not params:
+            raise TemplateError("Template has no params")
+        self.params = {}
+        for name, spec in params.items():
+            if not str(name).isidentifier():
+                raise TemplateError(f"Invalid parameter name {name!r}")
+            if isinstance(spec, dict) and spec.get('values'):
+                values = spec['values']
+                if not isinstance(values, list) or not all(_is_number(v) for v in values):
+                    raise TemplateError(f"Values of parameter {name!r} must be a list of numbers")
+                self.params[name] = ('values', tuple(values))
+            elif isinstance(spec, dict) and 'min' in spec and 'max' in spec:
+                low, high = spec['min'], spec['max']
+                step = spec.get('step', 1)
+                if not all(_is_number(v) for v in (low, high, step)):
+                    raise TemplateError(f"min, max and step of parameter {name!r} must be numbers")
+                if high < low or step <= 0:
+                    raise TemplateError(f"Invalid range for parameter {name!r}")
+                self.params[name] = ('range', (low, high, step, int(round((high - low) / step))))
+            else:
+                raise TemplateError(f"Parameter {name!r} needs values or min/max")
+
+        self.answer = SafeExpression(template.get('answer', ''))
+        self.distractors = tuple(SafeExpression(d) for d in template.get('distractors') or [])
+        known = set(self.params) | {'answer'}
+        for expression in (self.answer,) + self.distractors:
+            unknown = expression.names - known
+            if unknown:
+                raise TemplateError(f"Unknown names {sorted(unknown)} in {expression.source!r}")
+        if 'answer' in self.answer.names:
+            raise TemplateError("The answer expression cannot refer to itself")
+
+        self.answer_format = template.get('format') or '{:.4g}'
+        self.explanation = template.get('explanation') or ''
+        self.topic = str(template.get('topic') or '').strip() or 'Unknown'
+        self.subtopic = str(template.get('subtopic') or '').strip() or 'Unknown'
+        if not isinstance(self.answer_format, str) or not isinstance(self.explanation, str):
+            raise TemplateError("format and explanation must be strings")
+
+        # Catch formatting or evaluation errors now rather than mid-quiz
+        self.check_domain()
+
+    def _choice_count(self, name):
+        kind, spec = self.params[name]
+        return len(spec) if kind == 'values' else spec[3] + 1
+
+    def _choices(self, name):
+        kind, spec = self.params[name]
+        if kind == 'values':
+            return spec
+        low, high, step, count = spec
+        return tuple(round(low + i * step, 10) for i in range(count + 1))
+
+    def draw_params(self, rng):
+        values = {}
+        for name, (kind, spec) in self.params.items():
+            if kind == 'values':
+                values[name] = rng.choice(spec)
+            else:
+                low, high, step, count = spec
+                values[name] = round(low + rng.randint(0, count) * step, 10)
+        return values
+
+    def check_domain(self):
+        """
+        Build the question for every parameter combination, or for a sample
+        of them when there are more than DOMAIN_CHECK_LIMIT.
+
+        Raises:
+            TemplateError: Naming the first combination that fails
+        """
+        names = list(self.params)
+        domain_size = math.prod(self._choice_count(name) for name in names)
+        if domain_size <= DOMAIN_CHECK_LIMIT:
+            combinations = (dict(zip(names, combo)) for combo in itertools.product(*(self._choices(n) for n in names)))
+        else:
+            rng = random.Random(0)
+            combinations = (self.draw_params(rng) for _ in range(DOMAIN_CHECK_SAMPLES))
+        for values in combinations:
+            self._build(random.Random(0), values, *self._evaluate(values))
+
+    def _evaluate(self, values):
+        """(answer, distractor values) as floats - the same arithmetic instantiate_for_class does"""
+        floats = {name: float(value) for name, value in values.items()}
+        try:
+            answer = float(self.answer.evaluate(floats))
+            floats['answer'] = answer
+            distractor_values = [float(d.evaluate(floats)) for d in self.distractors]
+        except (ArithmeticError, ValueError, TypeError) as e:
+            raise TemplateError(f"Template could not be evaluated for {values}: {e}")
+        if not all(math.isfinite(v) for v in [answer] + distractor_values):
+            raise TemplateError(f"Template gives a non-finite value for {values}")
+        return answer, distractor_values
+
+    def _option_text(self, value):
+        text = _format(self.answer_format, 'format', value=value)
+        # Values that round to zero never show as "-0" / "-0.00"
+        if text.startswith('-'):
+            zero = _format(self.answer_format, 'format', value=0.0)
+            if _format(self.answer_format, 'format', value=-value) == zero:
+                return zero
+        return text
+
+    def _build(self, rng, values, answer, distractor_values):
+        """Format the options, fill in distractors and place the answer at a random letter"""
+        answer_text = self._option_text(answer)
+        texts = []
+
+        # Distractors first, then scaled answers when they collide or are
+        # missing, then answer +/- 1, 2, ... (scaling zero gives nothing new)
+        candidates = itertools.chain(
+            distractor_values,
+            (answer * (1 + sign * 0.1 * factor) for factor in range(1, 21) for sign in (1, -1)),
+            (answer + sign * offset for offset in range(1, 21) for sign in (1, -1)),
+        )
+        for value in candidates:
+            if len(texts) == len(OPTION_KEYS) - 1:
+                break
+            text = self._option_text(value)
+            if text != answer_text and text not in texts:
+                texts.append(text)
+        if len(texts) < len(OPTION_KEYS) - 1:
+            raise TemplateError(f"Could not make {len(OPTION_KEYS)} distinct options for {values} with format {self.answer_format!r}")
+
+        option_texts = [answer_text] + texts
+        rng.shuffle(option_texts)
+        options = dict(zip(OPTION_KEYS, option_texts))
+        correct_answer = OPTION_KEYS[option_texts.index(answer_text)]
+
+        shown = {name: format_number(v) for name, v in values.items()}
+        shown['answer'] = answer_text
+        return {
+            'question': _format(self.stem, 'stem', **shown),
+            'options': options,
+            'correct_answer': correct_answer,
+            'explanation': _format(self.explanation, 'explanation', **shown) if self.explanation else '',
+            'topic': self.topic,
+            'subtopic': self.subtopic,
+            'variant': {'params': values, 'answer': answer},
+        }
+
+    def instantiate(self, seed):
+        """
+        Build one concrete question dict (portal question schema) from a seed
+
+        Raises:
+            TemplateError: If the drawn parameters give no valid question
+        """
+        rng = random.Random(seed)
+        values = self.draw_params(rng)
+        return self._build(rng, values, *self._evaluate(values))
+
+
+def variant_seed(ticket_id, student_name, version, original_index):
+    return selection_seed(ticket_id, student_name, version, 'template', original_index)
+
+
+def instantiate_for_student(template, ticket_id, student_name, version):
+    """Variant of a compiled template for one student; the same student always gets the same one"""
+    return template.instantiate(variant_seed(ticket_id, student_name, version, template.original_index))
+
+
+def instantiate_for_class(template, ticket_id, roster, version):
+    """
+    Precompute every student's variant of a template. Parameters are drawn
+    per student, then the answer and distractor expressions are evaluated
+    once over numpy arrays for the whole class.
+
+    Only operations numpy computes exactly like Python floats are
+    vectorised; other templates, and any student whose values come out
+    non-finite, go through the per-student path, so the output always
+    matches instantiate_for_student.
+
+    Returns:
+        dict: student name -> question dict; students whose variant cannot
+        be built are left out
+    """
+    def one_by_one(names):
+        variants = {}
+        for name in names:
+            try:
+                variants[name] = instantiate_for_student(template, ticket_id, name, version)
+            except TemplateError as e:
+                print(f"No variant of question {template.original_index + 1} for {name}: {e}")
+        return variants
+
+    expressions = (template.answer,) + template.distractors
+    if not roster or not all(e.vectorizable for e in expressions):
+        return one_by_one(roster)
+
+    import numpy as np
+
+    def minimum(*args):
+        return reduce(np.minimum, args)
+
+    def maximum(*args):
+        return reduce(np.maximum, args)
+
+    numpy_functions = {'sqrt': np.sqrt, 'abs': np.abs, 'min': minimum, 'max': maximum}
+
+    rngs = [random.Random(variant_seed(ticket_id, name, version, template.original_index)) for name in roster]
+    draws = [template.draw_params(rng) for rng in rngs]
+    columns = {name: np.array([d[name] for d in draws], dtype=float) for name in template.params}
+    with np.errstate(all='ignore'):
+        answers = np.broadcast_to(template.answer.evaluate(columns, numpy_functions), (len(draws),)).astype(float)
+        distractors = [
+            np.broadcast_to(d.evaluate({**columns, 'answer': answers}, numpy_functions), (len(draws),)).astype(float)
+            for d in template.distractors
+        ]
+    finite = np.isfinite(answers)
+    for values in distractors:
+        finite &= np.isfinite(values)
+
+    variants = {}
+    fallback = []
+    for i, (name, rng) in enumerate(zip(roster, rngs)):
+        if not finite[i]:
+            # Python raises (e.g. division by zero) where numpy gives inf/nan
+            fallback.append(name)
+            continue
+        try:
+            variants[name] = template._build(rng, draws[i], float(answers[i]), [float(d[i]) for d in distractors])
+        except TemplateError:
+            fallback.append(name)
+    variants.update(one_by_one(fallback))
+    return variants
@@ -0,0 +1,307 @@
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import deque
+from contextlib import nullcontext
+
+from config import (
+    SESSION_IDLE_EVICT_SECONDS,
+    SESSION_REAPER_INTERVAL_SECONDS,
+    SESSION_MEMORY_TRACKING,
+    SESSION_MEMORY_GROWTH_ALERT_MB_PER_HOUR,
+)
+
+# Per-attempt quiz state and its reset values. Everything here is dropped
+# when a student starts over or when an idle session is evicted.
+QUIZ_STATE_DEFAULTS = {
+    "ticket_data": None,
+    "ticket_current_question": 0,
+    "ticket_user_answers": {},
+    "ticket_quiz_completed": False,
+    "ticket_show_feedback": False,
+    "ticket_last_user_answer": None,
+    "ticket_question_submitted": {},
+    "ticket_question_flags": {},
+    "ticket_selected_indices": None,
+    "ticket_questions": None,
+    "ticket_score": None,
+    "ticket_explanations": {},
+    "ticket_pending_access": None,
+    "response_saved": False,
+    "student_already_attempted": False,
+    "_checkpoint_snapshot": None,
+}
+
+# Keys that hold most of a session's memory
+HEAVY_QUIZ_KEYS = (
+    "ticket_data", "ticket_questions", "ticket_user_answers", "ticket_question_submitted",
+    "ticket_question_flags", "ticket_selected_indices", "_checkpoint_snapshot",
+)
+
+
+def _fresh(default):
+    # New containers per session - never share the default dicts
+    return type(default)() if isinstance(default, dict) else default
+
+
+def init_quiz_state(state):
+    """Add any missing quiz key with its default value"""
+    for key, default in QUIZ_STATE_DEFAULTS.items():
+        if key not in state:
+            state[key] = _fresh(default)
+
+
+def reset_quiz_state(state, keep_student=False):
+    """Put every quiz key back to its default so nothing from the last attempt lingers"""
+    for key, default in QUIZ_STATE_DEFAULTS.items():
+        state[key] = _fresh(default)
+    if not keep_student:
+        state["student_name"] = None
+    if "ticket_initialized" in state:
+        del state["ticket_initialized"]
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes held by an object and everything it references"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+class _StateView:
+    """Dict-style access to another session's SessionState"""
+
+    def __init__(self, state):
+        self._state = state
+
+    def get(self, key, default=None):
+        try:
+            return self._state[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        return self._state[key]
+
+    def __setitem__(self, key, value):
+        self._state[key] = value
+
+    def __delitem__(self, key):
+        del self._state[key]
+
+    def __contains__(self, key):
+        try:
+            self._state[key]
+            return True
+        except KeyError:
+            return False
+
+
+def _current_session():
+    """
+    (session_id, SessionState, SafeSessionState) of the running script, or
+    (None, None, None).
+
+    ctx.session_state is a SafeSessionState wrapper that Streamlit builds
+    anew for every script run, so it is gone soon after the run ends. The
+    SessionState inside it lives as long as the session itself.
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None, None, None
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None, None, None
+    run_state = ctx.session_state
+    return ctx.session_id, getattr(run_state, '_state', run_state), run_state
+
+
+class SessionLifecycleManager:
+    """
+    Tracks the last activity of every session in this process, evicts
+    heavy quiz state from sessions idle for too long (checkpointing it
+    first), and watches process memory for steady growth.
+    """
+
+    def __init__(self, db, idle_seconds=SESSION_IDLE_EVICT_SECONDS, interval=SESSION_REAPER_INTERVAL_SECONDS):
+        self.db = db
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        # session_id -> {'state': weakref, 'run_state': weakref or None, 'lock': Lock, 'last_seen': float, 'bytes': int}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._memory_history = deque(maxlen=120)  # (timestamp, traced bytes)
+        self._baseline_snapshot = None
+        self.evicted = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-reaper", daemon=True)
+
+        if SESSION_MEMORY_TRACKING and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def touch(self):
+        """
+        Record activity for the session running this script. Call it before
+        the script reads any quiz state: it waits for an eviction of this
+        session in progress, so the run sees all of the quiz state or none.
+        """
+        session_id, state, run_state = _current_session()
+        if session_id is None:
+            return
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry['state']() is not state:
+                entry = {'state': weakref.ref(state), 'lock': threading.Lock(), 'bytes': 0}
+                self._sessions[session_id] = entry
+            entry['run_state'] = weakref.ref(run_state) if run_state is not state else None
+        with entry['lock']:
+            entry['last_seen'] = time.time()
+
+    def _evict(self, state, run_state=None):
+        from session_store import checkpoint_session
+
+        view = _StateView(state)
+        if view.get("ticket_data") is None:
+            return False
+        # A finished attempt cannot be resumed - re-entering the code reports it as completed
+        if view.get("ticket_quiz_completed") or view.get("response_saved"):
+            return False
+        # Also hold the lock of a script run still attached to the session
+        with getattr(run_state, '_lock', None) or nullcontext():
+            # Save progress first so re-entering the code resumes where the student left off
+            checkpoint_session(self.db, view)
+            reset_quiz_state(view, keep_student=True)
+            view["ticket_session_evicted"] = True
+        return True
+
+    def reap(self):
+        """Evict idle sessions and refresh per-session memory; returns how many were evicted"""
+        now = time.time()
+        with self._lock:
+            entries = list(self._sessions.items())
+
+        evicted = 0
+        for session_id, entry in entries:
+            state = entry['state']()
+            if state is None:
+                # Streamlit already dropped the session
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                continue
+
+            view = _StateView(state)
+            if now - entry['last_seen'] > self.idle_seconds:
+                run_state = entry['run_state']() if entry.get('run_state') else None
+                with entry['lock']:
+                    # A run may have started since the check above
+                    if time.time() - entry['last_seen'] > self.idle_seconds:
+                        try:
+                            if self._evict(state, run_state):
+                                evicted += 1
+                        except Exception as e:
+                            print(f"Error evicting session {session_id}: {e}")
+
+            entry['bytes'] = sum(deep_sizeof(view.get(key)) for key in HEAVY_QUIZ_KEYS)
+
+        self.evicted += evicted
+        self._check_memory_growth(now)
+        return evicted
+
+    def _check_memory_growth(self, now):
+        if not tracemalloc.is_tracing():
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        self._memory_history.append((now, current))
+        if self._baseline_snapshot is None:
+            self._baseline_snapshot = tracemalloc.take_snapshot()
+
+        slope = self.memory_growth_per_hour()
+        if slope is not None and slope > SESSION_MEMORY_GROWTH_ALERT_MB_PER_HOUR * 1024 * 1024:
+            top = tracemalloc.take_snapshot().compare_to(self._baseline_snapshot, 'lineno')[:5]
+            print(f"WARNING: worker memory growing at {slope / 1024 / 1024:.1f} MB/hour "
+                  f"({current / 1024 / 1024:.1f} MB traced). Top growth since start:")
+            for stat in top:
+                print(f"  {stat}")
+
+    def memory_growth_per_hour(self):
+        """Least-squares slope of traced memory in bytes/hour, or None with too few samples"""
+        if len(self._memory_history) < 5:
+            return None
+        t0 = self._memory_history[0][0]
+        xs = [(t - t0) / 3600 for t, _ in self._memory_history]
+        ys = [b for _, b in self._memory_history]
+        mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+        if var_x == 0:
+            return None
+        return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+    def memory_report(self):
+        """Per-session and total quiz-state bytes plus process-level tracemalloc figures"""
+        now = time.time()
+        with self._lock:
+            sessions = {
+                session_id: {'bytes': entry['bytes'], 'idle_seconds': round(now - entry['last_seen'])}
+                for session_id, entry in self._sessions.items()
+            }
+        report = {
+            'sessions': len(sessions),
+            'session_bytes_total': sum(s['bytes'] for s in sessions.values()),
+            'evicted_sessions': self.evicted,
+            'per_session': sessions,
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            report['traced_bytes'] = current
+            report['traced_peak_bytes'] = peak
+            report['growth_bytes_per_hour'] = self.memory_growth_per_hour()
+        return report
+
+    def _run(self):
+        from shared_cache import get_shared_cache
+
+        while not self._stop.wait(self.interval):
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"Error in session reaper: {e}")
+            # Expired attempt markers and entries of old cache versions are otherwise kept forever
+            cache = get_shared_cache()
+            if cache:
+                cache.purge_expired()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_lifecycle_manager(db):
+    """Start this process's lifecycle manager once; safe to call on every rerun"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SessionLifecycleManager(db)
+            _manager.start()
+    return _manager
@@ -0,0 +1,251 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import SESSION_STORE_BACKEND, SESSION_STORE_PATH
+
+# Quiz progress saved per student and ticket. Map fields are keyed by the
+# question's original index; Firestore and JSON need string keys.
+CHECKPOINT_SCALARS = ("ticket_current_question", "ticket_quiz_completed", "ticket_selected_indices")
+CHECKPOINT_MAPS = ("ticket_user_answers", "ticket_question_submitted", "ticket_question_flags")
+
+# Marker for map entries that were removed since the last checkpoint
+DELETED = object()
+
+
+def normalize_student_name(student_name):
+    """Collapse case and whitespace so 'Jane  Doe' and 'jane doe' match"""
+    return " ".join((student_name or "").lower().split())
+
+
+def student_doc_id(student_name):
+    """Normalised student name usable in a Firestore document ID, which cannot contain '/'"""
+    return normalize_student_name(student_name).replace("/", "_")
+
+
+def checkpoint_key(ticket_id, student_name):
+    return f"{ticket_id.upper().strip()}:{student_doc_id(student_name)}"
+
+
+def snapshot_session(state):
+    """Extract the checkpointed fields of session state in serialisable form"""
+    snapshot = {}
+    for field in CHECKPOINT_SCALARS:
+        value = state.get(field)
+        snapshot[field] = list(value) if isinstance(value, (list, tuple)) else value
+    for field in CHECKPOINT_MAPS:
+        snapshot[field] = {str(k): v for k, v in (state.get(field) or {}).items()}
+    return snapshot
+
+
+def diff_snapshots(previous, current):
+    """
+    Compute the changes between two snapshots as {path: value}, where a path
+    is either a field name or 'field.key' for a single map entry.
+    """
+    previous = previous or {}
+    changes = {}
+    for field in CHECKPOINT_SCALARS:
+        if field not in previous or previous[field] != current[field]:
+            changes[field] = current[field]
+    for field in CHECKPOINT_MAPS:
+        old_map = previous.get(field, {})
+        new_map = current[field]
+        for key, value in new_map.items():
+            if key not in old_map or old_map[key] != value:
+                changes[f"{field}.{key}"] = value
+        for key in old_map:
+            if key not in new_map:
+                changes[f"{field}.{key}"] = DELETED
+    return changes
+
+
+def apply_changes(snapshot, changes):
+    """Apply a diff produced by diff_snapshots to a snapshot dict in place"""
+    for path, value in changes.items():
+        field, _, key = path.partition(".")
+        if not key:
+            snapshot[field] = value
+        elif value is DELETED:
+            snapshot.setdefault(field, {}).pop(key, None)
+        else:
+            snapshot.setdefault(field, {})[key] = value
+    return snapshot
+
+
+class SessionStore:
+    """Interface for quiz progress checkpoints"""
+
+    def load(self, ticket_id, student_name):
+        """Return the saved snapshot, or None if there is no checkpoint"""
+        raise NotImplementedError
+
+    def save(self, ticket_id, student_name, changes):
+        """Apply a diff from diff_snapshots to the stored checkpoint"""
+        raise NotImplementedError
+
+    def delete(self, ticket_id, student_name):
+        raise NotImplementedError
+
+
+class SQLiteSessionStore(SessionStore):
+    """Checkpoints in a local SQLite file, for single-node installs"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def load(self, ticket_id, student_name):
+        # The connection is shared across threads; save may be mid-transaction on it
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM checkpoints WHERE key = ?", (checkpoint_key(ticket_id, student_name),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, ticket_id, student_name, changes):
+        key = checkpoint_key(ticket_id, student_name)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM checkpoints WHERE key = ?", (key,)).fetchone()
+                snapshot = apply_changes(json.loads(row[0]) if row else {}, changes)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (key, data, updated_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(snapshot, separators=(',', ':')), time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, ticket_id, student_name):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE key = ?", (checkpoint_key(ticket_id, student_name),))
+
+
+class FirestoreSessionStore(SessionStore):
+    """Checkpoints in the session_checkpoints collection, shared by all workers"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _doc(self, ticket_id, student_name):
+        return self.db.collection("session_checkpoints").document(checkpoint_key(ticket_id, student_name))
+
+    def load(self, ticket_id, student_name):
+        doc = self._doc(ticket_id, student_name).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        data.pop("updated_at", None)
+        return data
+
+    def save(self, ticket_id, student_name, changes):
+        from firebase_admin import firestore
+
+        # Nested merge only touches the changed map entries
+        update = {"updated_at": firestore.SERVER_TIMESTAMP}
+        for path, value in changes.items():
+            field, _, key = path.partition(".")
+            value = firestore.DELETE_FIELD if value is DELETED else value
+            if key:
+                update.setdefault(field, {})[key] = value
+            else:
+                update[field] = value
+        self._doc(ticket_id, student_name).set(update, merge=True)
+
+    def delete(self, ticket_id, student_name):
+        self._doc(ticket_id, student_name).delete()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store(db=None):
+    """Return the configured session store, or None if checkpointing is disabled"""
+    global _store
+    if SESSION_STORE_BACKEND == "none":
+        return None
+    with _store_lock:
+        if _store is None:
+            if SESSION_STORE_BACKEND == "firestore":
+                _store = FirestoreSessionStore(db)
+            else:
+                _store = SQLiteSessionStore(SESSION_STORE_PATH)
+    return _store
+
+
+def checkpoint_session(db, state):
+    """
+    Save the quiz progress in session state if it changed since the last
+    checkpoint. Only the changed fields and map entries are written.
+    """
+    store = get_session_store(db)
+    ticket_data = state.get("ticket_data")
+    student_name = state.get("student_name")
+    if store is None or not ticket_data or not student_name:
+        return
+
+    current = snapshot_session(state)
+    changes = diff_snapshots(state.get("_checkpoint_snapshot"), current)
+    if not changes:
+        return
+
+    try:
+        store.save(ticket_data["ticket_id"], student_name, changes)
+        state["_checkpoint_snapshot"] = current
+    except Exception as e:
+        print(f"Error saving session checkpoint: {e}")
+
+
+def restore_session(db, state, ticket_id, student_name):
+    """
+    Rehydrate quiz progress from a checkpoint written by any worker
+
+    Returns:
+        bool: True if progress was restored
+    """
+    store = get_session_store(db)
+    if store is None:
+        return False
+
+    try:
+        snapshot = store.load(ticket_id, student_name)
+    except Exception as e:
+        print(f"Error loading session checkpoint: {e}")
+        return False
+    if not snapshot:
+        return False
+
+    for field in CHECKPOINT_SCALARS:
+        if snapshot.get(field) is not None:
+            state[field] = snapshot[field]
+    for field in CHECKPOINT_MAPS:
+        state[field] = {int(k): v for k, v in (snapshot.get(field) or {}).items()}
+
+    # Everything is already stored, so only later changes need writing
+    state["_checkpoint_snapshot"] = snapshot_session(state)
+    return True
+
+
+def clear_session_checkpoint(db, ticket_id, student_name):
+    """Remove the checkpoint once the response has been saved"""
+    store = get_session_store(db)
+    if store is None:
+        return
+    try:
+        store.delete(ticket_id, student_name)
+    except Exception as e:
+        print(f"Error deleting session checkpoint: {e}")
@@ -0,0 +1,328 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from config import (
+    SHARED_CACHE_BACKEND,
+    SHARED_CACHE_PATH,
+    REDIS_URL,
+    CACHE_KEY_PREFIX,
+)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot cache a value of type {type(value).__name__}")
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def encode_value(value):
+    """
+    Serialise a cached value as JSON. Datetimes (e.g. Firestore timestamps)
+    survive the round trip; nothing read back from a shared server is ever
+    unpickled.
+    """
+    return json.dumps(value, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+
+def decode_value(raw):
+    return json.loads(raw.decode('utf-8') if isinstance(raw, bytes) else raw, object_hook=_json_object_hook)
+
+
+# Default for the version argument of SharedCache.get/set: the namespace's current version
+CURRENT_VERSION = object()
+
+
+class CacheBackend:
+    """Minimal key/value interface shared by all cache backends"""
+
+    def get(self, key):
+        """Return the stored bytes, or None if missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl):
+        """Store only if the key is absent (or expired); returns True if stored"""
+        raise NotImplementedError
+
+    def incr(self, key):
+        """Atomically increment an integer counter and return the new value"""
+        raise NotImplementedError
+
+
+class RedisCache(CacheBackend):
+    """
+    Backend for any Redis-protocol server shared by all workers.
+    Pass client= to use an existing client, e.g. fakeredis in local testing.
+    """
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis package is required for SHARED_CACHE_BACKEND=redis: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=max(int(ttl), 1))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, value, ex=max(int(ttl), 1), nx=True))
+
+    def incr(self, key):
+        return int(self.client.incr(key))
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Backend in a local SQLite file, shared by all workers on one machine.
+    Reads go through SQLite's memory-mapped I/O.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA mmap_size=67108864")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and (row[0] is None or row[0] >= now):
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, now + ttl),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+                value = int(row[0]) + 1 if row else 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, NULL)",
+                    (key, str(value).encode()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def purge_expired(self):
+        """Delete expired entries; expired entries are otherwise only skipped"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+
+
+class SharedCache:
+    """
+    Versioned cache on top of a backend.
+
+    Entries live in namespaces (e.g. one per ticket). Each namespace has a
+    version stamp stored in the backend; keys embed the current version, so
+    bumping it invalidates every entry of the namespace on every worker at
+    once. None is a cacheable value, which allows negative caching.
+
+    When caching a value loaded from Firestore, read version() before the
+    load and pass it to get and set. An invalidation that lands during the
+    load then leaves the stale value under the old version, where no one
+    reads it.
+    """
+
+    def __init__(self, backend, prefix=CACHE_KEY_PREFIX):
+        self.backend = backend
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _version_key(self, namespace):
+        return f"{self.prefix}:ver:{namespace}"
+
+    def version(self, namespace):
+        """Current version of a namespace, or None if the backend is unreachable"""
+        try:
+            raw = self.backend.get(self._version_key(namespace))
+        except Exception as e:
+            self._count('errors')
+            print(f"Error reading shared cache version: {e}")
+            return None
+        return int(raw) if raw else 0
+
+    def _key(self, namespace, key, version):
+        if version is CURRENT_VERSION:
+            version = self.version(namespace)
+        if version is None:
+            return None
+        return f"{self.prefix}:{namespace}:v{version}:{key}"
+
+    def get(self, namespace, key, version=CURRENT_VERSION):
+        """
+        Args:
+            version: Namespace version from version(); defaults to the current one
+
+        Returns:
+            tuple: (hit, value) - value may be None for a cached negative result
+        """
+        try:
+            cache_key = self._key(namespace, key, version)
+            raw = self.backend.get(cache_key) if cache_key else None
+            value = decode_value(raw) if raw is not None else None
+        except Exception as e:
+            self._count('errors')
+            print(f"Error reading shared cache: {e}")
+            return False, None
+        if raw is None:
+            self._count('misses')
+            return False, None
+        self._count('hits')
+        return True, value
+
+    def set(self, namespace, key, value, ttl, version=CURRENT_VERSION):
+        """
+        Args:
+            version: Version read before the value was loaded from its source;
+                defaults to the current one, which suits write-through of fresh data
+        """
+        try:
+            cache_key = self._key(namespace, key, version)
+            if cache_key:
+                self.backend.set(cache_key, encode_value(value), ttl)
+        except Exception as e:
+            self._count('errors')
+            print(f"Error writing shared cache: {e}")
+
+    def claim(self, namespace, key, ttl):
+        """
+        Take a short-lived cross-worker claim, e.g. on work only one worker
+        should do. The claim expires after ttl seconds even if its holder
+        dies. If the backend is unreachable the caller proceeds as if it
+        had the claim.
+
+        Returns:
+            bool: True if this caller holds the claim
+        """
+        try:
+            return self.backend.add(f"{self.prefix}:claim:{namespace}:{key}", b"1", ttl)
+        except Exception as e:
+            self._count('errors')
+            print(f"Error claiming in shared cache: {e}")
+            return True
+
+    def release(self, namespace, key):
+        try:
+            self.backend.delete(f"{self.prefix}:claim:{namespace}:{key}")
+        except Exception as e:
+            self._count('errors')
+            print(f"Error releasing shared cache claim: {e}")
+
+    def invalidate(self, namespace):
+        """Bump the namespace version so all workers stop using old entries"""
+        try:
+            self.backend.incr(self._version_key(namespace))
+        except Exception as e:
+            self._count('errors')
+            print(f"Error invalidating shared cache: {e}")
+
+    def purge_expired(self):
+        """Delete expired entries from backends that keep them (Redis expires keys itself)"""
+        purge = getattr(self.backend, 'purge_expired', None)
+        if purge is None:
+            return
+        try:
+            purge()
+        except Exception as e:
+            self._count('errors')
+            print(f"Error purging shared cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Return the configured shared cache, or None if caching is disabled"""
+    global _cache
+    if SHARED_CACHE_BACKEND == "none":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            if SHARED_CACHE_BACKEND == "redis":
+                _cache = SharedCache(RedisCache(REDIS_URL))
+            else:
+                _cache = SharedCache(SQLiteCache(SHARED_CACHE_PATH))
+    return _cache
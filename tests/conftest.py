@@ -0,0 +1,154 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FieldFilter:
+    def __init__(self, field_path, op_string, value):
+        self.field_path, self.op_string, self.value = field_path, op_string, value
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = dict(data) if data is not None else None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self.collection, self.id = collection, doc_id
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self, self.collection.docs.get(self.id))
+
+    def set(self, data, merge=False):
+        self.collection.docs[self.id] = {**self.collection.docs.get(self.id, {}), **data} if merge else dict(data)
+
+    def update(self, data):
+        self.collection.docs[self.id].update(data)
+
+    def delete(self):
+        self.collection.docs.pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), order=None, limit=None, after=None):
+        self.collection, self.filters, self.order, self._limit, self.after = collection, filters, order, limit, after
+
+    def _copy(self, **changes):
+        fields = dict(filters=self.filters, order=self.order, limit=self._limit, after=self.after)
+        fields.update(changes)
+        return FakeQuery(self.collection, **fields)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        filter = filter or FieldFilter(field, op, value)
+        return self._copy(filters=self.filters + (filter,))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(order=(field, direction))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot.id)
+
+    def stream(self):
+        ids = [doc_id for doc_id, data in self.collection.docs.items()
+               if all(f.op_string == "==" and data.get(f.field_path) == f.value for f in self.filters)]
+        if self.order:
+            field, direction = self.order
+            ids.sort(key=lambda doc_id: self.collection.docs[doc_id].get(field), reverse=direction == "DESCENDING")
+        if self.after is not None:
+            ids = ids[ids.index(self.after) + 1:]
+        if self._limit is not None:
+            ids = ids[:self._limit]
+        return iter([self.collection.document(doc_id).get() for doc_id in ids])
+
+    get = lambda self: list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self):
+        super().__init__(self)
+        self.docs = {}
+
+    def document(self, doc_id):
+        if "/" in doc_id:
+            raise ValueError(f"A document must have an even number of path elements: {doc_id!r}")
+        return FakeDocument(self, doc_id)
+
+    def add(self, data):
+        doc_id = f"doc{len(self.docs)}"
+        self.docs[doc_id] = dict(data)
+        return None, self.document(doc_id)
+
+
+class FakeBatch:
+    """Applies each write immediately"""
+
+    def set(self, reference, data, merge=False):
+        reference.set(data, merge=bool(merge))
+
+    def delete(self, reference):
+        reference.delete()
+
+    def commit(self):
+        pass
+
+
+class FakeFirestore:
+    """In-memory stand-in for the handful of Firestore calls the helpers make"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    def batch(self):
+        return FakeBatch()
+
+    def transaction(self):
+        return None
+
+
+@pytest.fixture
+def firebase_helper(monkeypatch):
+    """firebase_helper imported against stub firebase_admin/google.cloud modules"""
+    firestore = types.SimpleNamespace(
+        SERVER_TIMESTAMP=object(),
+        DELETE_FIELD=object(),
+        Query=types.SimpleNamespace(DESCENDING="DESCENDING", ASCENDING="ASCENDING"),
+        ArrayUnion=lambda values: list(values),
+        transactional=lambda fn: fn,
+        client=FakeFirestore,
+    )
+    firebase_admin = types.ModuleType("firebase_admin")
+    firebase_admin.firestore = firestore
+    firebase_admin.credentials = types.SimpleNamespace()
+    firebase_admin._apps = {}
+    base_query = types.ModuleType("google.cloud.firestore_v1.base_query")
+    base_query.FieldFilter = FieldFilter
+    monkeypatch.setitem(sys.modules, "firebase_admin", firebase_admin)
+    monkeypatch.setitem(sys.modules, "firebase_admin.firestore", firestore)
+    for name in ("google", "google.cloud", "google.cloud.firestore_v1"):
+        if name not in sys.modules:
+            monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules, "google.cloud.firestore_v1.base_query", base_query)
+
+    monkeypatch.delitem(sys.modules, "firebase_helper", raising=False)
+    module = importlib.import_module("firebase_helper")
+    yield module
+    sys.modules.pop("firebase_helper", None)
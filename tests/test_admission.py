@@ -0,0 +1,78 @@
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import admission
+from admission import AdmissionController, AdmissionRejected, SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow_load(key):
+        calls.append(key)
+        release.wait(2)
+        return {"ticket_id": key}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("ABC123", slow_load, "ABC123")))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.coalesced < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["ABC123"]
+    assert results == [{"ticket_id": "ABC123"}] * 5
+    # Finished calls are forgotten, so the next load reads again
+    assert flight.do("ABC123", lambda key: "fresh", "ABC123") == "fresh"
+
+
+def test_controller_rejects_when_no_slot_frees_up():
+    gate = AdmissionController(max_concurrent=1, max_wait=0.05, retry_after=1.0)
+    with gate.slot():
+        with pytest.raises(AdmissionRejected) as rejected:
+            gate.call(lambda: None)
+    assert rejected.value.retry_after >= 1.0
+    assert gate.call(lambda: "admitted") == "admitted"
+
+    metrics = gate.metrics()
+    assert metrics["admitted"] == 2 and metrics["rejected"] == 1
+    assert metrics["max_queue_depth"] == 1 and metrics["queue_depth"] == 0 and metrics["active"] == 0
+
+
+def test_coalesced_rejections_get_their_own_retry_delay(monkeypatch):
+    gate = AdmissionController(max_concurrent=1, max_wait=0.3, retry_after=1.0)
+    flight = SingleFlight()
+    monkeypatch.setattr(admission, "firestore_gate", gate)
+    monkeypatch.setattr(admission, "ticket_loads", flight)
+    monkeypatch.setitem(sys.modules, "firebase_helper",
+                        types.SimpleNamespace(get_exit_ticket=lambda db, ticket_id: {"ticket_id": ticket_id}))
+
+    delays = []
+
+    def student():
+        try:
+            admission.load_ticket(None, "abc123")
+        except AdmissionRejected as e:
+            delays.append(e.retry_after)
+
+    # Every Firestore slot is busy for the whole burst
+    with gate.slot():
+        students = [threading.Thread(target=student) for _ in range(10)]
+        for thread in students:
+            thread.start()
+        for thread in students:
+            thread.join()
+
+    assert len(delays) == 10
+    assert flight.coalesced > 0
+    assert len(set(delays)) == 10
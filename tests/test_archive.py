@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import archive
+from archive import LocalArchiveStore, merge_responses
+from conftest import FakeFirestore
+
+START = datetime(2024, 3, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def response(ticket_id, student_name, minutes):
+    return {
+        "ticket_id": ticket_id,
+        "student_name": student_name,
+        "responses": {"0": "A"},
+        "score": {"correct_count": 1, "total_questions": 1, "percentage": 100},
+        "flags": {},
+        "completed_at": START + timedelta(minutes=minutes),
+    }
+
+
+@pytest.fixture
+def archived_db(firebase_helper, monkeypatch, tmp_path):
+    """OLD001 archived with Ana and Ben; Ana also answered NEW001, which is still hot"""
+    monkeypatch.setattr(firebase_helper, "get_shared_cache", lambda: None)
+    store = LocalArchiveStore(str(tmp_path))
+    monkeypatch.setattr(archive, "get_archive_store", lambda: store)
+    monkeypatch.setattr(archive, "_read_cache", type(archive._read_cache)())
+
+    db = FakeFirestore()
+    ticket = {"ticket_id": "OLD001", "teacher_name": "Ms Ohm", "subject": "Circuits", "status": "expired",
+              "created_at": START, "questions": [{"question": "Q?", "correct_answer": "A", "topic": "Ohm"}]}
+    db.collection("tickets").document("OLD001").set(ticket)
+    db.collection("tickets").document("NEW001").set({**ticket, "ticket_id": "NEW001", "status": "active"})
+    responses = db.collection("student_responses")
+    responses.add(response("OLD001", "Ana", 0))
+    responses.add(response("OLD001", "Ben", 1))
+    responses.add(response("NEW001", "Ana", 60))
+    archive.archive_ticket(db, store, ticket)
+    return db
+
+
+def test_merge_drops_hot_copies_of_archived_rows():
+    archived = [response("T1", "Ana", 0)]
+    hot = [response("T1", "Ana", 0), response("T1", "Cai", 5)]
+    assert [r["student_name"] for r in merge_responses(hot, archived)] == ["Ana", "Cai"]
+
+
+def test_reactivated_ticket_returns_archived_and_new_responses(firebase_helper, archived_db):
+    db = archived_db
+    # A leftover hot row from an interrupted archive run, and a new attempt after reactivation
+    db.collection("student_responses").add(response("OLD001", "Ben", 1))
+    db.collection("student_responses").add(response("OLD001", "Cai", 90))
+
+    rows = firebase_helper.get_ticket_responses(db, "OLD001")
+    assert sorted(r["student_name"] for r in rows) == ["Ana", "Ben", "Cai"]
+
+
+def test_archived_attempt_blocks_a_second_attempt(firebase_helper, archived_db):
+    assert firebase_helper.check_student_already_attempted(archived_db, "OLD001", "Ben")
+    assert not firebase_helper.check_student_already_attempted(archived_db, "OLD001", "Cai")
+
+
+def all_pages(firebase_helper, db, student_name):
+    tickets, cursor = [], None
+    while True:
+        rows, cursor = firebase_helper.get_student_responses_page(db, student_name, page_size=1, start_after=cursor)
+        tickets.extend(r["ticket_id"] for r in rows)
+        if cursor is None:
+            return tickets
+
+
+def test_history_pages_include_archived_responses(firebase_helper, archived_db):
+    db = archived_db
+    assert all_pages(firebase_helper, db, "Ana") == ["NEW001", "OLD001"]
+    assert [r["ticket_id"] for r in firebase_helper.get_student_response_history(db, "Ana")] == ["NEW001", "OLD001"]
+
+    db.collection("student_responses").add(response("OLD001", "Ben", 1))  # leftover copy
+    assert all_pages(firebase_helper, db, "Ben") == ["OLD001"]
+
+
+def test_backfill_counts_archived_responses(firebase_helper, archived_db):
+    import backfill_student_summaries
+
+    summaries = backfill_student_summaries.build_summaries(archived_db, batch_size=2)
+    assert summaries["ana"]["attempt_count"] == 2
+    assert summaries["ben"]["attempt_count"] == 1
+    assert summaries["ana"]["topics"]["Ohm"]["answered"] == 2
@@ -0,0 +1,94 @@
+import sys
+import threading
+import time
+import types
+
+import explanations
+import shared_cache
+from shared_cache import SharedCache, SQLiteCache
+
+
+def test_workers_share_one_model_call(monkeypatch, tmp_path):
+    """Two workers ask for the same explanation at once; only one calls the model"""
+    stored = {}
+    calls = []
+
+    def save_question_explanation(db, ticket_id, question_index, explanation):
+        stored[(ticket_id, question_index)] = explanation
+
+    def slow_generator(question):
+        calls.append(question.original_index)
+        time.sleep(0.3)
+        return "Because V = IR."
+
+    monkeypatch.setitem(sys.modules, "firebase_helper",
+                        types.SimpleNamespace(save_question_explanation=save_question_explanation))
+    cache = SharedCache(SQLiteCache(str(tmp_path / "cache.db")))
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+    monkeypatch.setattr(explanations, "_stored_explanation",
+                        lambda db, ticket_id, original_index: stored.get((ticket_id, original_index)))
+    monkeypatch.setattr(explanations, "_generator", slow_generator)
+    monkeypatch.setattr(explanations, "EXPLANATION_POLL_SECONDS", 0.05)
+
+    question = types.SimpleNamespace(original_index=2)
+    results = []
+    # _generate_and_store directly, as two workers would: single-flight is per process
+    workers = [
+        threading.Thread(target=lambda: results.append(explanations._generate_and_store(None, "ABC123", question)))
+        for _ in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert calls == [2]
+    assert results == ["Because V = IR.", "Because V = IR."]
+    # The claim is released, so a later regeneration is not blocked
+    assert cache.claim("explanation:ABC123", "2", 60)
+
+
+def offline_ticket(monkeypatch, tmp_path):
+    stored = {}
+    monkeypatch.setitem(sys.modules, "firebase_helper", types.SimpleNamespace(
+        save_question_explanation=lambda db, ticket_id, index, text: stored.__setitem__((ticket_id, index), text)))
+    cache = SharedCache(SQLiteCache(str(tmp_path / "cache.db")))
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+    monkeypatch.setattr(explanations, "_stored_explanation",
+                        lambda db, ticket_id, original_index: stored.get((ticket_id, original_index)))
+    monkeypatch.setattr(explanations, "_explanations", explanations.OrderedDict())
+    return cache
+
+
+def compiled_question(index):
+    return types.SimpleNamespace(original_index=index, explanation="", option_labels=("A) 5 V", "B) 20 V"),
+                                 correct_position=1)
+
+
+def test_student_is_not_held_while_another_worker_generates(monkeypatch, tmp_path):
+    cache = offline_ticket(monkeypatch, tmp_path)
+    monkeypatch.setattr(explanations, "_generator", explanations.stub_explanation)
+    monkeypatch.setattr(explanations, "EXPLANATION_WAIT_SECONDS", 0.2)
+    monkeypatch.setattr(explanations, "EXPLANATION_POLL_SECONDS", 0.05)
+    # A worker that died mid-generation still holds the 60 s claim
+    assert cache.claim("explanation:ABC123", "0", 60)
+
+    started = time.time()
+    assert explanations.get_explanation(None, "ABC123", compiled_question(0)) is None
+    assert time.time() - started < 1
+
+    # The failure is not cached: once the claim lapses the next request generates it
+    cache.release("explanation:ABC123", "0")
+    assert explanations.get_explanation(None, "ABC123", compiled_question(0)) == "The correct answer is B) 20 V."
+
+
+def test_process_cache_is_bounded(monkeypatch, tmp_path):
+    offline_ticket(monkeypatch, tmp_path)
+    monkeypatch.setattr(explanations, "_generator", explanations.stub_explanation)
+    monkeypatch.setattr(explanations, "EXPLANATION_CACHE_SIZE", 2)
+
+    for index in range(3):
+        explanations.get_explanation(None, "ABC123", compiled_question(index))
+    explanations.get_explanation(None, "ABC123", compiled_question(1))
+    explanations.get_explanation(None, "ABC123", compiled_question(3))
+    assert list(explanations._explanations) == [("ABC123", 1), ("ABC123", 3)]
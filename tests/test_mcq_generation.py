@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+from mcq_generation import measure_corpus, parse_model_output, repair_question, repair_questions
+from ticket_compiler import validate_question
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcq_repair_corpus.jsonl")
+
+
+def _load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _keys(output):
+    keys = []
+    for question_data in parse_model_output(output) or []:
+        question, _ = repair_question(question_data)
+        keys.append(None if validate_question(question, 0) else question["correct_answer"])
+    return keys
+
+
+@pytest.mark.parametrize("row", _load_corpus(), ids=lambda row: row["output"][:40])
+def test_corpus_row_gets_expected_key(row):
+    assert _keys(row["output"]) == row["expected"]
+
+
+def test_corpus_repair_and_reject_counts():
+    result = measure_corpus(CORPUS)
+    assert result["outputs"] == 17
+    assert result["unparseable_outputs"] == 1
+    assert result["questions"] == 17
+    assert result["valid"] == 12
+    assert result["repaired"] == 8
+    assert result["rejected"] == 5
+    assert result["wrong_keys"] == 0
+
+
+def test_prose_answer_starting_with_a_is_rejected():
+    question = {
+        "question": "What happens across a resistor when current flows through it?",
+        "options": {"A": "A voltage drop", "B": "A current gain", "C": "No change", "D": "A resistance rise"},
+        "correct_answer": "a voltage rise",
+    }
+    valid, rejected, _ = repair_questions([question])
+    assert valid == [] and rejected == 1
+
+
+def test_dropped_letter_is_not_mapped_onto_a_relettered_option():
+    question = {"question": "Unit of current?", "options": {"A": "Ampere", "B": "Volt", "D": "Ohm"}, "correct_answer": "C"}
+    repaired, _ = repair_question(question)
+    assert repaired["options"] == {"A": "Ampere", "B": "Volt", "C": "Ohm"}
+    assert validate_question(repaired, 0)
@@ -0,0 +1,49 @@
+import prewarm
+import shared_cache
+from prewarm import load_student_plan, precompute_student_plans
+from shared_cache import SharedCache, SQLiteCache
+from ticket_compiler import compile_ticket, questions_for_student, select_for_student
+
+TICKET = {
+    "ticket_id": "ABC123",
+    "questions": [
+        {
+            "type": "template",
+            "stem": "A {R} ohm resistor carries {I} A. What is the voltage across it?",
+            "params": {"R": {"min": 10, "max": 100, "step": 10}, "I": {"values": [0.5, 1, 1.5, 2]}},
+            "answer": "R * I",
+            "distractors": ["R / I", "R + I", "answer * 2"],
+            "format": "{:.2f} V",
+        },
+    ] + [
+        {"question": f"Question {i}?", "options": {"A": "Yes", "B": "No"}, "correct_answer": "A"}
+        for i in range(5)
+    ],
+}
+ROSTER = ["Alice", "Bob", "Cara", "Dev"]
+
+
+def test_students_use_the_precomputed_plan(monkeypatch, tmp_path):
+    cache = SharedCache(SQLiteCache(str(tmp_path / "cache.db")))
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+    compiled = compile_ticket(TICKET)
+
+    precompute_student_plans(cache, compiled, TICKET, ROSTER)
+
+    plans = {name: load_student_plan(compiled, f" {name.lower()} ") for name in ROSTER}
+    assert any(plan["variants"] for plan in plans.values())
+    for name, plan in plans.items():
+        assert plan["indices"] == select_for_student(compiled, TICKET, name, prewarm.DEFAULT_QUESTIONS_COUNT)
+        from_plan = questions_for_student(compiled, plan["indices"], name, plan["variants"])
+        computed = questions_for_student(compiled, plan["indices"], name)
+        assert from_plan[0] == computed[0]
+        assert [q.option_labels for q in from_plan[1]] == [q.option_labels for q in computed[1]]
+        assert [q.variant for q in from_plan[1]] == [q.variant for q in computed[1]]
+
+    assert load_student_plan(compiled, "Someone Else") is None
+    # Storing an explanation invalidates the cached ticket but not the plans
+    cache.invalidate("ticket:ABC123")
+    assert load_student_plan(compiled, "Alice") == plans["Alice"]
+    # Editing the questions changes the bank version, so every plan is ignored
+    edited = {**TICKET, "questions": TICKET["questions"][:-1]}
+    assert load_student_plan(compile_ticket(edited), "Alice") is None
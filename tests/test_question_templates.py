@@ -0,0 +1,103 @@
+import pytest
+
+import question_templates
+import ticket_compiler
+from question_templates import CompiledTemplate, TemplateError, instantiate_for_class, instantiate_for_student
+from ticket_compiler import compile_ticket, questions_for_student, validate_question
+
+OHMS_LAW = {
+    "type": "template",
+    "stem": "A {R} ohm resistor carries {I} A. What is the voltage across it?",
+    "params": {"R": {"min": 10, "max": 100, "step": 10}, "I": {"values": [0.5, 1, 1.5, 2]}},
+    "answer": "R * I",
+    "distractors": ["R / I", "R + I", "answer * 2"],
+    "format": "{:.2f} V",
+    "explanation": "V = I x R = {I} x {R} = {answer}",
+    "topic": "Circuits",
+    "subtopic": "Ohm's law",
+}
+ROSTER = [f"Student {i}" for i in range(40)]
+
+
+def template(**changes):
+    return {**OHMS_LAW, **changes}
+
+
+@pytest.mark.parametrize("changes", [
+    {"stem": r"What is \frac{1}{R} for R = {R}?"},
+    {"format": "{:.2f V"},
+    {"stem": "What is {X}?"},
+    {"params": {"R": {"min": "1", "max": 5}, "I": {"values": [1]}}},
+    {"params": {"R": {"values": ["ten"]}, "I": {"values": [1]}}},
+    {"answer": "__import__('os').system('true')"},
+    {"answer": "R.real"},
+    {"answer": "1 / (R - R)"},
+    # R = 0 is in the domain: rejected at compile time, not for some students mid-quiz
+    {"params": {"R": {"min": 0, "max": 5}, "I": {"values": [1]}}, "answer": "1 / R", "distractors": []},
+])
+def test_invalid_templates_are_reported_not_raised(changes):
+    problems = validate_question(template(**changes), 0)
+    assert problems and problems[0].startswith("Question 1:")
+
+
+def test_literal_braces_can_be_escaped():
+    question = CompiledTemplate(template(stem=r"What is \frac{{1}}{{R}} for R = {R}?"), 0).instantiate(1)
+    assert question["question"].startswith(r"What is \frac{1}{R} for R = ")
+
+
+def test_variant_is_stable_per_student_and_scores_its_own_answer():
+    compiled = compile_ticket({"ticket_id": "ABC123", "questions": [OHMS_LAW]})
+    first = questions_for_student(compiled, [0], "Alice")[1][0]
+    again = questions_for_student(compiled, [0], "  alice ")[1][0]
+    assert first.option_labels == again.option_labels
+    params = first.variant["params"]
+    assert first.option_texts[first.correct_position] == f"{params['R'] * params['I']:.2f} V"
+
+
+def test_zero_answer_still_gets_four_distinct_options():
+    zero = template(params={"R": {"values": [3]}, "I": {"values": [3]}}, answer="R - I", distractors=[], format="{:.4g}")
+    options = CompiledTemplate(zero, 0).instantiate(7)["options"]
+    assert len(set(options.values())) == 4
+    assert "-0" not in options.values()
+
+
+@pytest.mark.parametrize("changes", [
+    {},
+    {"answer": "R * I", "distractors": ["max(R, I, 3)", "min(R, I, 1) + 5", "R ** 2"]},
+    # Not vectorised at all: transcendental functions
+    {"answer": "sin(R) * I + 10", "distractors": ["cos(R)", "log10(R)"]},
+])
+def test_class_precomputation_matches_per_student_variants(changes):
+    compiled = CompiledTemplate(template(**changes), 3)
+    variants = instantiate_for_class(compiled, "ABC123", ROSTER, "v1")
+    assert variants == {name: instantiate_for_student(compiled, "ABC123", name, "v1") for name in ROSTER}
+
+
+def test_class_precomputation_leaves_out_students_python_rejects(monkeypatch):
+    # Skip the compile-time domain check so some students draw R = 0
+    monkeypatch.setattr(question_templates, "DOMAIN_CHECK_LIMIT", 0)
+    monkeypatch.setattr(question_templates, "DOMAIN_CHECK_SAMPLES", 0)
+    compiled = CompiledTemplate(template(params={"R": {"min": 0, "max": 3}, "I": {"values": [1, 2]}},
+                                         answer="12 / R", distractors=["R", "answer / I"]), 0)
+
+    expected = {}
+    for name in ROSTER:
+        try:
+            expected[name] = instantiate_for_student(compiled, "ABC123", name, "v1")
+        except TemplateError:
+            pass
+    assert 0 < len(expected) < len(ROSTER)
+    assert instantiate_for_class(compiled, "ABC123", ROSTER, "v1") == expected
+
+
+def test_failed_variant_is_replaced_by_another_question(monkeypatch):
+    plain = {"question": "Unit of resistance?", "options": {"A": "Ohm", "B": "Volt"}, "correct_answer": "A"}
+    compiled = compile_ticket({"ticket_id": "ABC123", "questions": [OHMS_LAW, plain, plain]})
+
+    def fail(*args):
+        raise TemplateError("no variant")
+
+    monkeypatch.setattr(ticket_compiler, "instantiate_for_student", fail)
+    indices, questions = questions_for_student(compiled, [0, 2], "Alice")
+    assert indices == [1, 2]
+    assert [q.original_index for q in questions] == [1, 2]
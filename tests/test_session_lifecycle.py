@@ -0,0 +1,126 @@
+import gc
+import threading
+import sys
+import time
+import types
+
+import session_lifecycle
+import session_store
+from session_lifecycle import SessionLifecycleManager
+
+
+class FakeSessionState(dict):
+    """Stands in for Streamlit's SessionState, which outlives script runs"""
+
+
+class FakeSafeSessionState:
+    """Stands in for the per-run SafeSessionState wrapper"""
+
+    def __init__(self, state):
+        self._state = state
+
+
+def run_script(monkeypatch, manager, session_id, state):
+    """Simulate one script run: a fresh wrapper around the session's state, dropped afterwards"""
+    ctx = types.SimpleNamespace(session_id=session_id, session_state=FakeSafeSessionState(state))
+    scriptrunner = types.ModuleType("streamlit.runtime.scriptrunner")
+    scriptrunner.get_script_run_ctx = lambda: ctx
+    monkeypatch.setitem(sys.modules, "streamlit", types.ModuleType("streamlit"))
+    monkeypatch.setitem(sys.modules, "streamlit.runtime", types.ModuleType("streamlit.runtime"))
+    monkeypatch.setitem(sys.modules, "streamlit.runtime.scriptrunner", scriptrunner)
+    manager.touch()
+    ctx.session_state = None  # the run is over
+
+
+def test_idle_session_is_evicted_after_its_run_ends(monkeypatch):
+    checkpoints = []
+    monkeypatch.setattr(session_store, "checkpoint_session", lambda db, state: checkpoints.append(state["ticket_data"]))
+
+    manager = SessionLifecycleManager(db=None, idle_seconds=60, interval=3600)
+    state = FakeSessionState(student_name="Alice")
+    session_lifecycle.init_quiz_state(state)
+    state["ticket_data"] = {"ticket_id": "ABC123", "questions": []}
+    state["ticket_user_answers"] = {0: "A"}
+
+    run_script(monkeypatch, manager, "session-1", state)
+    gc.collect()  # the run's wrapper is gone, the session is not
+
+    # Not idle yet
+    assert manager.reap() == 0
+    assert state["ticket_data"] is not None
+
+    manager._sessions["session-1"]["last_seen"] = time.time() - 61
+    assert manager.reap() == 1
+
+    assert checkpoints == [{"ticket_id": "ABC123", "questions": []}]
+    assert state["ticket_data"] is None
+    assert state["ticket_user_answers"] == {}
+    assert state["student_name"] == "Alice"
+    assert state["ticket_session_evicted"] is True
+    assert manager.memory_report()["evicted_sessions"] == 1
+
+
+def test_dropped_session_is_forgotten(monkeypatch):
+    manager = SessionLifecycleManager(db=None, idle_seconds=60, interval=3600)
+    state = FakeSessionState()
+    run_script(monkeypatch, manager, "session-2", state)
+
+    del state
+    gc.collect()
+    assert manager.reap() == 0
+    assert manager.memory_report()["sessions"] == 0
+
+
+def quiz_session(**changes):
+    state = FakeSessionState(student_name="Alice")
+    session_lifecycle.init_quiz_state(state)
+    state["ticket_data"] = {"ticket_id": "ABC123", "questions": []}
+    state.update(changes)
+    return state
+
+
+def test_finished_attempts_are_not_evicted(monkeypatch):
+    monkeypatch.setattr(session_store, "checkpoint_session", lambda db, state: None)
+    manager = SessionLifecycleManager(db=None, idle_seconds=60, interval=3600)
+    completed = quiz_session(ticket_quiz_completed=True)
+    saved = quiz_session(ticket_quiz_completed=True, response_saved=True)
+    run_script(monkeypatch, manager, "completed", completed)
+    run_script(monkeypatch, manager, "saved", saved)
+
+    for entry in manager._sessions.values():
+        entry["last_seen"] = time.time() - 61
+    assert manager.reap() == 0
+    assert completed["ticket_data"] is not None and saved["ticket_data"] is not None
+    assert "ticket_session_evicted" not in completed
+
+
+def test_new_run_waits_for_an_eviction_in_progress(monkeypatch):
+    checkpointing, resume = threading.Event(), threading.Event()
+
+    def slow_checkpoint(db, state):
+        checkpointing.set()
+        resume.wait(2)
+
+    monkeypatch.setattr(session_store, "checkpoint_session", slow_checkpoint)
+    manager = SessionLifecycleManager(db=None, idle_seconds=60, interval=3600)
+    state = quiz_session(ticket_user_answers={0: "A"})
+    run_script(monkeypatch, manager, "session-3", state)
+    manager._sessions["session-3"]["last_seen"] = time.time() - 61
+
+    reaper = threading.Thread(target=manager.reap)
+    reaper.start()
+    checkpointing.wait(2)
+
+    # The student comes back while the reaper is partway through
+    seen = []
+    student = threading.Thread(target=lambda: (run_script(monkeypatch, manager, "session-3", state),
+                                               seen.append((state["ticket_data"], state["ticket_user_answers"]))))
+    student.start()
+    student.join(0.2)
+    assert seen == []
+
+    resume.set()
+    reaper.join()
+    student.join()
+    assert seen == [(None, {})]
+    assert state["ticket_session_evicted"] is True
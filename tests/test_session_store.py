@@ -0,0 +1,35 @@
+import threading
+
+from conftest import FakeFirestore
+from session_store import FirestoreSessionStore, SQLiteSessionStore, checkpoint_key, diff_snapshots
+
+
+def test_checkpoint_key_is_a_valid_document_id():
+    assert checkpoint_key(" abc123", "Ana  Lee/Smith") == "ABC123:ana lee_smith"
+
+
+def test_firestore_checkpoint_for_name_with_slash(firebase_helper):
+    store = FirestoreSessionStore(FakeFirestore())
+    changes = diff_snapshots(None, {
+        "ticket_current_question": 1, "ticket_quiz_completed": False, "ticket_selected_indices": [3, 0],
+        "ticket_user_answers": {"3": "B"}, "ticket_question_submitted": {"3": True}, "ticket_question_flags": {},
+    })
+    store.save("ABC123", "Ana/Lee", changes)
+
+    loaded = store.load("abc123", "ana/lee")
+    assert loaded["ticket_user_answers"] == {"3": "B"}
+    assert loaded["ticket_selected_indices"] == [3, 0]
+
+
+def test_sqlite_load_waits_for_a_save_in_progress(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.save("ABC123", "Ana", {"ticket_current_question": 2})
+
+    loaded = []
+    with store._lock:
+        reader = threading.Thread(target=lambda: loaded.append(store.load("ABC123", "Ana")))
+        reader.start()
+        reader.join(0.1)
+        assert loaded == []
+    reader.join()
+    assert loaded == [{"ticket_current_question": 2}]
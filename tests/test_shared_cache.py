@@ -0,0 +1,40 @@
+import time
+
+from conftest import FakeFirestore
+from shared_cache import SharedCache, SQLiteCache
+
+
+def test_invalidation_during_a_read_is_not_overwritten(firebase_helper, monkeypatch, tmp_path):
+    """A ticket closed while another worker is reading it must not be cached as still active"""
+    cache = SharedCache(SQLiteCache(str(tmp_path / "cache.db")))
+    monkeypatch.setattr(firebase_helper, "get_shared_cache", lambda: cache)
+    db = FakeFirestore()
+    tickets = db.collection("tickets")
+    tickets.document("ABC123").set({"ticket_id": "ABC123", "status": "active"})
+
+    document = type(tickets.document("ABC123"))
+    original_get = document.get
+
+    def get_then_close(self, transaction=None):
+        snapshot = original_get(self, transaction)
+        # Another worker closes the ticket after this read but before it is cached
+        monkeypatch.setattr(document, "get", original_get)
+        firebase_helper.update_ticket_status(db, "ABC123", "expired")
+        return snapshot
+
+    monkeypatch.setattr(document, "get", get_then_close)
+    assert firebase_helper.get_exit_ticket(db, "ABC123")["status"] == "active"
+    assert firebase_helper.get_exit_ticket(db, "ABC123")["status"] == "expired"
+
+
+def test_purge_removes_expired_entries(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "cache.db"))
+    cache = SharedCache(backend)
+    cache.set("attempt:ABC123", "Ana", True, 0.01)
+    cache.set("attempt:ABC123", "Ben", True, 60)
+    time.sleep(0.05)
+
+    cache.purge_expired()
+    keys = [row[0] for row in backend._conn.execute("SELECT key FROM cache")]
+    assert not any(key.endswith(":Ana") for key in keys)
+    assert any(key.endswith(":Ben") for key in keys)
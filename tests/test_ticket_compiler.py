@@ -0,0 +1,33 @@
+import copy
+
+from ticket_compiler import get_compiled_ticket
+
+TICKET = {
+    "ticket_id": "OHM001",
+    "questions": [
+        {"question": "Unit of resistance?", "options": {"A": "Volt", "B": "Ohm"}, "correct_answer": "B",
+         "explanation": "Resistance is measured in ohms.", "topic": "Circuits", "subtopic": "Units"},
+    ],
+}
+
+
+def test_editing_options_recompiles():
+    compiled = get_compiled_ticket(TICKET)
+    assert compiled.questions[0].option_labels == ('A) Volt', 'B) Ohm')
+
+    # Swapping the option texts to fix a wrong key leaves the question text and answer alone
+    edited = copy.deepcopy(TICKET)
+    edited["questions"][0]["options"] = {"A": "Ohm", "B": "Volt"}
+    recompiled = get_compiled_ticket(edited)
+    assert recompiled is not compiled
+    assert recompiled.questions[0].option_labels == ('A) Ohm', 'B) Volt')
+
+
+def test_editing_explanations_recompiles():
+    compiled = get_compiled_ticket(TICKET)
+
+    edited = copy.deepcopy(TICKET)
+    edited["questions"][0]["explanation"] = "R = V / I, measured in ohms."
+    assert get_compiled_ticket(edited).questions[0].explanation == "R = V / I, measured in ohms."
+
+    assert get_compiled_ticket(copy.deepcopy(TICKET)) is compiled
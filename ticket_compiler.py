@@ -0,0 +1,295 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from question_selection import bank_version, select_question_indices
+from question_templates import CompiledTemplate, TemplateError, instantiate_for_student
+
+# Options are always shown in this order - no randomization
+OPTION_KEYS = ('A', 'B', 'C', 'D')
+
+# Number of compiled tickets kept per process
+COMPILED_CACHE_SIZE = 256
+
+
+class TicketValidationError(ValueError):
+    """Raised when a ticket has no usable questions"""
+
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+class CompiledQuestion:
+    """
+    Read-only, render-ready form of one question. Options are stored as
+    parallel tuples in display order, so render code only does indexed
+    lookups. variant holds the drawn parameters when the question was
+    instantiated from a template, otherwise None.
+    """
+
+    __slots__ = (
+        'original_index', 'text', 'option_keys', 'option_texts', 'option_labels',
+        'option_positions', 'correct_answer', 'correct_position', 'explanation',
+        'topic', 'subtopic', 'summary_label', 'variant',
+    )
+
+    def __init__(self, original_index, text, options, correct_answer, explanation, topic, subtopic, variant=None):
+        self.original_index = original_index
+        self.text = text
+        self.option_keys = tuple(key for key in OPTION_KEYS if key in options)
+        self.option_texts = tuple(options[key] for key in self.option_keys)
+        self.option_labels = tuple(f"{key}) {option_text}" for key, option_text in zip(self.option_keys, self.option_texts))
+        self.option_positions = {key: i for i, key in enumerate(self.option_keys)}
+        self.correct_answer = correct_answer
+        self.correct_position = self.option_positions[correct_answer]
+        self.explanation = explanation
+        self.topic = topic
+        self.subtopic = subtopic
+        self.summary_label = f"{text[:50]}..."
+        self.variant = variant
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError(f"CompiledQuestion is read-only: cannot set {name}")
+        super().__setattr__(name, value)
+
+    def __reduce__(self):
+        # Rebuild through __init__ so pickling works with the read-only guard
+        options = dict(zip(self.option_keys, self.option_texts))
+        return (CompiledQuestion, (self.original_index, self.text, options, self.correct_answer,
+                                   self.explanation, self.topic, self.subtopic, self.variant))
+
+
+class CompiledTicket:
+    """
+    Compiled question bank of a ticket. questions and answer_key are indexed
+    by original_index; invalid questions are None and excluded from
+    valid_indices. Template questions are CompiledTemplate objects with no
+    answer key entry - use question_for_student to get a student's variant.
+    """
+
+    __slots__ = ('ticket_id', 'bank_version', 'questions', 'answer_key', 'valid_indices', 'problems')
+
+    def __init__(self, ticket_id, version, questions, problems):
+        self.ticket_id = ticket_id
+        self.bank_version = version
+        self.questions = tuple(questions)
+        self.answer_key = tuple(getattr(q, 'correct_answer', None) for q in self.questions)
+        self.valid_indices = tuple(i for i, q in enumerate(self.questions) if q is not None)
+        self.problems = tuple(problems)
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+def validate_question(question_data, index):
+    """
+    Check one question against the schema the portal renders
+
+    Returns:
+        list: Problem descriptions, empty if the question is valid
+    """
+    label = f"Question {index + 1}"
+    if not isinstance(question_data, dict):
+        return [f"{label}: not an object"]
+    if question_data.get('type') == 'template':
+        try:
+            CompiledTemplate(question_data, index)
+        except TemplateError as e:
+            return [f"{label}: {e}"]
+        return []
+
+    problems = []
+    if not _text(question_data.get('question')):
+        problems.append(f"{label}: missing question text")
+
+    options = question_data.get('options')
+    if not isinstance(options, dict):
+        problems.append(f"{label}: missing options")
+        options = {}
+    present = [key for key in OPTION_KEYS if _text(options.get(key))]
+    if len(present) < 2:
+        problems.append(f"{label}: needs at least two of options {', '.join(OPTION_KEYS)}")
+
+    correct_answer = _text(question_data.get('correct_answer')).upper()
+    if correct_answer not in present:
+        problems.append(f"{label}: correct_answer {question_data.get('correct_answer')!r} is not one of its options")
+
+    return problems
+
+
+def compile_question(question_data, index, stored_explanation=None):
+    """
+    Build a CompiledQuestion from a validated question dict
+
+    Args:
+        stored_explanation: Lazily generated explanation saved on the ticket, if any
+    """
+    if question_data.get('type') == 'template':
+        return CompiledTemplate(question_data, index)
+
+    options = {key: _text(question_data['options'].get(key)) for key in OPTION_KEYS}
+    options = {key: text for key, text in options.items() if text}
+    return CompiledQuestion(
+        original_index=index,
+        text=_text(question_data['question']),
+        options=options,
+        correct_answer=_text(question_data['correct_answer']).upper(),
+        explanation=_text(question_data.get('explanation')) or _text(stored_explanation),
+        topic=_text(question_data.get('topic')) or 'Unknown',
+        subtopic=_text(question_data.get('subtopic')) or 'Unknown',
+        variant=question_data.get('variant'),
+    )
+
+
+def question_for_student(compiled, index, student_name):
+    """
+    CompiledQuestion a student sees for one original index. Templates are
+    instantiated from the student's seed, so the variant is the same on
+    every rerun and worker.
+    """
+    question = compiled.questions[index]
+    if not isinstance(question, CompiledTemplate):
+        return question
+    variant = instantiate_for_student(question, compiled.ticket_id, student_name, compiled.bank_version)
+    return compile_question(variant, index)
+
+
+def select_for_student(compiled, ticket_data, student_name, count, stratify=False):
+    """Original indices of the valid questions a student is given"""
+    questions = ticket_data.get('questions', [])
+    positions = select_question_indices(
+        compiled.ticket_id,
+        student_name,
+        [questions[i] for i in compiled.valid_indices],
+        count,
+        compiled.bank_version,
+        stratify=stratify,
+    )
+    return [compiled.valid_indices[p] for p in positions]
+
+
+def questions_for_student(compiled, indices, student_name, variants=None):
+    """
+    Compiled questions for a student's selected indices. A template whose
+    variant cannot be built for this student is replaced by the next valid
+    question not already selected.
+
+    Args:
+        variants: Precomputed variant dicts keyed by str(original index), if any
+
+    Returns:
+        tuple: (original indices actually used, list of CompiledQuestion)
+    """
+    variants = variants or {}
+    used, questions = [], []
+    spares = [i for i in compiled.valid_indices if i not in indices]
+    for index in indices:
+        while index is not None:
+            try:
+                if str(index) in variants and isinstance(compiled.questions[index], CompiledTemplate):
+                    questions.append(compile_question(variants[str(index)], index))
+                else:
+                    questions.append(question_for_student(compiled, index, student_name))
+                used.append(index)
+                break
+            except TemplateError as e:
+                print(f"Ticket {compiled.ticket_id}: replacing question {index + 1} for {student_name}: {e}")
+                index = spares.pop(0) if spares else None
+    return used, questions
+
+
+def variant_records(questions):
+    """
+    What each templated question looked like for this student, keyed by
+    original index, for storing with the response
+    """
+    return {
+        question.original_index: {
+            'params': question.variant['params'],
+            'question': question.text,
+            'options': dict(zip(question.option_keys, question.option_texts)),
+            'correct_answer': question.correct_answer,
+        }
+        for question in questions if question.variant
+    }
+
+
+def compile_ticket(ticket_data):
+    """
+    Validate and compile every question of a ticket. Invalid questions are
+    skipped (and listed in problems) so one bad question from the model
+    doesn't take the whole ticket down.
+
+    Raises:
+        TicketValidationError: If no question is usable
+    """
+    compiled = []
+    problems = []
+    stored_explanations = ticket_data.get('explanations') or {}
+    for index, question_data in enumerate(ticket_data.get('questions') or []):
+        question_problems = validate_question(question_data, index)
+        if question_problems:
+            problems.extend(question_problems)
+            compiled.append(None)
+        else:
+            compiled.append(compile_question(question_data, index, stored_explanations.get(str(index))))
+
+    if not any(compiled):
+        raise TicketValidationError(problems or ["Ticket has no questions"])
+
+    return CompiledTicket(ticket_data.get('ticket_id'), bank_version(ticket_data), compiled, problems)
+
+
+def validate_ticket(ticket_data):
+    """
+    Strict check for the ticket save path: every question must be valid
+
+    Raises:
+        TicketValidationError: Listing every problem found
+    """
+    compiled = compile_ticket(ticket_data)
+    if compiled.problems:
+        raise TicketValidationError(list(compiled.problems))
+    return compiled
+
+
+_compiled_cache = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def ticket_content_hash(ticket_data):
+    """
+    Hash of everything a compiled ticket is built from: the full question
+    dicts (options, explanations and template fields included), the stored
+    lazy explanations and the bank version
+    """
+    content = [ticket_data.get('questions') or [], ticket_data.get('explanations') or {}, bank_version(ticket_data)]
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_compiled_ticket(ticket_data):
+    """
+    Compile a ticket once per process and ticket content. Any edit to the
+    questions or their stored explanations changes the key, so stale
+    entries are never reused.
+    """
+    key = (ticket_data.get('ticket_id'), ticket_content_hash(ticket_data))
+    with _compiled_lock:
+        compiled = _compiled_cache.get(key)
+        if compiled is not None:
+            _compiled_cache.move_to_end(key)
+            return compiled
+
+    compiled = compile_ticket(ticket_data)
+    if compiled.problems:
+        print(f"Ticket {compiled.ticket_id} has invalid questions: {'; '.join(compiled.problems)}")
+
+    with _compiled_lock:
+        _compiled_cache[key] = compiled
+        while len(_compiled_cache) > COMPILED_CACHE_SIZE:
+            _compiled_cache.popitem(last=False)
+    return compiled